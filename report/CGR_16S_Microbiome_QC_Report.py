@@ -132,8 +132,16 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 import seaborn as sns
 import glob
+import sys
+import yaml
 from skbio.stats.ordination import pcoa
 from skbio import DistanceMatrix
+from scipy.spatial.distance import squareform
+
+# pipeline modules, for reading outputs such as feature-table.sparse.h5
+with open(glob.glob('*.y[a]*ml')[0]) as f:
+    sys.path.insert(0, os.path.join(yaml.safe_load(f)['exec_dir'], 'workflow', 'scripts'))
+from sparse_feature_table import SparseFeatureTable
 
 sns.set(style="whitegrid")
 
@@ -196,13 +204,7 @@ get_ipython().system('grep -A4 "dada2_denoise" *.y[a]*ml')
 # In[ ]:
 
 
-get_ipython().system('unzip -q -d taxonomic_classification/rpt_silva taxonomic_classification/{ref_db}/barplots.qzv')
-
-
-# In[ ]:
-
-
-f = glob.glob('taxonomic_classification/rpt_silva/*/data/level-1.csv')
+f = glob.glob('taxonomic_classification/' + ref_db + '/barplots_data_files/level-1.csv')
 df_l1 = pd.read_csv(f[0])
 df_l1 = df_l1.rename(columns = {'index':'Sample'})
 df_l1 = df_l1.set_index('Sample')
@@ -319,13 +321,7 @@ else:
 # In[ ]:
 
 
-get_ipython().system('unzip -q -d taxonomic_classification_bacteria_only/rpt_silva taxonomic_classification_bacteria_only/{ref_db}/barplots.qzv')
-
-
-# In[ ]:
-
-
-f = glob.glob('taxonomic_classification_bacteria_only/rpt_silva/*/data/level-1.csv')
+f = glob.glob('taxonomic_classification_bacteria_only/' + ref_db + '/barplots_data_files/level-1.csv')
 df_l1b = pd.read_csv(f[0])
 df_l1b = df_l1b.rename(columns = {'index':'Sample'})
 df_l1b = df_l1b.set_index('Sample')
@@ -476,8 +472,10 @@ get_ipython().system('unzip -q -d read_feature_and_sample_filtering/feature_tabl
 # In[ ]:
 
 
+with SparseFeatureTable('denoising/feature_tables/feature-table.sparse.h5') as t:
+    n_features, n_samples = t.shape
 get_ipython().system('echo "Feature counts:"')
-get_ipython().system('echo "no_filtering" $(grep -cv "^#" denoising/feature_tables/feature-table.from_biom.txt)')
+get_ipython().system('echo "no_filtering" {n_features}')
 get_ipython().system('echo "remove_samples_with_low_read_count" $(wc -l read_feature_and_sample_filtering/feature_tables/rpt_1/*/data/feature-frequency-detail.csv | cut -d\' \' -f1)')
 get_ipython().system('echo "remove_features_with_low_read_count" $(wc -l read_feature_and_sample_filtering/feature_tables/rpt_2/*/data/feature-frequency-detail.csv | cut -d\' \' -f1)')
 get_ipython().system('echo "remove_features_with_low_sample_count" $(wc -l read_feature_and_sample_filtering/feature_tables/rpt_3/*/data/feature-frequency-detail.csv | cut -d\' \' -f1)')
@@ -488,7 +486,7 @@ get_ipython().system('echo "remove_samples_with_low_feature_count" $(wc -l read_
 
 
 get_ipython().system('echo "Sample counts:"')
-get_ipython().system('echo "no_filtering" $(grep -m1 "^#OTU" denoising/feature_tables/feature-table.from_biom.txt | tr "\\t" "\\n" | grep -cv "^#")')
+get_ipython().system('echo "no_filtering" {n_samples}')
 get_ipython().system('echo "remove_samples_with_low_read_count" $(wc -l read_feature_and_sample_filtering/feature_tables/rpt_1/*/data/sample-frequency-detail.csv | cut -d\' \' -f1)')
 get_ipython().system('echo "remove_features_with_low_read_count" $(wc -l read_feature_and_sample_filtering/feature_tables/rpt_2/*/data/sample-frequency-detail.csv | cut -d\' \' -f1)')
 get_ipython().system('echo "remove_features_with_low_sample_count" $(wc -l read_feature_and_sample_filtering/feature_tables/rpt_3/*/data/sample-frequency-detail.csv | cut -d\' \' -f1)')
@@ -542,7 +540,7 @@ if 'externalid' in manifest_no_blanks.columns:
     levels = [2,3,4,5,6,7]
     for n in levels:
         cos_list = []
-        f = glob.glob('taxonomic_classification/rpt_silva/*/data/level-' + str(n) + '.csv')
+        f = glob.glob('taxonomic_classification/' + ref_db + '/barplots_data_files/level-' + str(n) + '.csv')
         df_dups = compare_replicates(f, l)
         for a, b in zip(dup1_sample, dup2_sample):
             cos_list.append(1 - cosine(df_dups.loc[a,],df_dups.loc[b,]))
@@ -582,7 +580,7 @@ else:
 def plot_rel_abundances_in_QCs(samples,qc_pop):
     levels = [2,3,4,5,6]
     for n in levels:
-        f = glob.glob('taxonomic_classification/rpt_silva/*/data/level-' + str(n) + '.csv')
+        f = glob.glob('taxonomic_classification/' + ref_db + '/barplots_data_files/level-' + str(n) + '.csv')
         df = pd.read_csv(f[0],index_col=0)
         df = df[df.index.isin(samples)]
         df = df.select_dtypes(['number']).dropna(axis=1, how='all').loc[:,~(df==0.0).all(axis=0)]
@@ -768,15 +766,6 @@ plt.show()
 # In[ ]:
 
 
-get_ipython().system('unzip -q -d diversity_core_metrics/{ref_db}/rpt_bray-curtis_dist diversity_core_metrics/{ref_db}/bray-curtis_dist.qza')
-get_ipython().system('unzip -q -d diversity_core_metrics/{ref_db}/rpt_weighted_dist diversity_core_metrics/{ref_db}/weighted_dist.qza')
-get_ipython().system('unzip -q -d diversity_core_metrics/{ref_db}/rpt_unweighted_dist diversity_core_metrics/{ref_db}/unweighted_dist.qza')
-get_ipython().system('unzip -q -d diversity_core_metrics/{ref_db}/rpt_jaccard_dist diversity_core_metrics/{ref_db}/jaccard_dist.qza')
-
-
-# In[ ]:
-
-
 if len(manifest['run-id'].astype(str).str.split('_',n=2,expand=True).columns) > 1:
     m['Sequencer'] = (manifest['run-id'].astype(str).str.split('_',n=2,expand=True))[1]
     m['run-id'] = (manifest['run-id'].astype(str).str.split('-',expand=True)[1])
@@ -809,10 +798,10 @@ warnings.filterwarnings("ignore", message="The result contains negative eigenval
 def plot_pcoas(metric):
     mpl.rcParams['figure.dpi'] = 100
     mpl.rcParams['figure.figsize'] = 9, 6
-    df = pd.read_csv(glob.glob('diversity_core_metrics/' + ref_db + '/rpt_' + metric + '_dist/*/data/distance-matrix.tsv')[0],sep='\t',index_col=0)
-    sample_ids = df.index.values
-    dist = df.to_numpy()
-    dm = DistanceMatrix(dist, sample_ids)
+    prefix = 'diversity_core_metrics/' + ref_db + '/' + metric + '_dist'
+    dist = np.load(prefix + '.condensed.npy', mmap_mode='r')  # written by distance_matrix.py
+    sample_ids = open(prefix + '.ids.txt').read().splitlines()
+    dm = DistanceMatrix(squareform(dist, checks=False), sample_ids)
     pc = pcoa(dm)
     var1 = str(round(pc.proportion_explained[0]*100, 2))
     var2 = str(round(pc.proportion_explained[1]*100, 2))
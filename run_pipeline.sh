@@ -9,7 +9,7 @@
 #     B. Ballew
 # 
 # TO RUN:
-#     Have perl and conda in $PATH
+#     Have conda in $PATH
 #     Have QIIME2 conda environment set up as in Q2 docs
 #     Copy config.yaml to local dir and edit as needed
 #     Edit below and then run: `bash run_pipeline.sh`
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+
+"""Synthetic-data scaling benchmarks for the CGR QIIME2 pipeline.
+
+AUTHORS:
+    B. Ballew
+
+Generates synthetic paired fastqs, internal and external manifests
+(same layout as tests/input/), and QIIME2-style artifacts for N
+samples spread over M run IDs, then times the pipeline stages that
+do not depend on QIIME2 itself.  The qiime executable is replaced
+by the stub in tests/benchmark/bin/, so rules that call qiime run
+in milliseconds and what remains is snakemake, shell, and python
+overhead - exactly the parts that can go superlinear as projects
+grow.
+
+Stages:
+    dag            snakemake -n on the full workflow
+    validate       manifest validation and parsing (Q2Manifest.py)
+    manifest       check_manifest through combine_Q2_manifest_by_runID
+    header_fix     fix_qiita_fastq_header_r1/r2 (external data)
+    pairing        fix_unpaired_reads (requires bbmap's repair.sh)
+    merge          merge_feature_tables and merge_sequence_tables
+    filter         read/feature/sample filtering rules
+    taxa_collapse  level-1..7 tables (collapse_taxonomy.py)
+    report_prep    QC report data loading (barplots_data_files
+                   level-N csvs, feature-table.sparse.h5 counts,
+                   condensed distance matrices)
+
+Stages whose external tools are not in $PATH are reported as
+skipped rather than failing the run.
+
+OUTPUT:
+    - <out>.tsv: one row per stage and sample count
+    - stdout: per-stage scaling exponent (slope of log(time) vs.
+      log(samples)); exponents above --max-exponent are flagged
+
+TO RUN:
+    python3 tests/benchmark/scaling_benchmark.py --sizes 10,100,1000
+"""
+
+import argparse
+import collections
+import gzip
+import io
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+exec_dir = os.path.dirname(os.path.dirname(bench_dir))
+stub_dir = os.path.join(bench_dir, 'bin')
+
+MANIFEST_HEADER = ['#SampleID', 'External-ID', 'Sample-Type', 'Source-Material',
+                   'Source-PCR-Plate', 'Run-ID', 'Project-ID', 'Reciept', 'Sample_Cat',
+                   'SubjectID', 'Sample_Aliquot', 'Ext_Company', 'Ext_Kit', 'Ext_Robot',
+                   'Homo_Method', 'Homo-Holder', 'Homo-Holder2', 'AFA Setting1',
+                   'AFA Setting2', 'Extraction Batch', 'Residual or Original', 'Row',
+                   'Column']
+RANKS = ['k', 'p', 'c', 'o', 'f', 'g', 's']
+DIST_METRICS = ['bray-curtis', 'jaccard', 'weighted', 'unweighted']
+REF = 'stub-nb-classifier'
+
+
+"""Synthetic data generation"""
+
+
+def run_ids(n_runs):
+    """Return MiSeq-style run IDs (aka flow cells)."""
+    return ['18%04d_M0%04d_%04d_000000000-B%04X' % (i % 10000, 1354 + i % 2, i, i)
+            for i in range(n_runs)]
+
+
+def sample_ids(n_samples):
+    """Return sample IDs that satisfy the QIIME2 manifest rules.
+
+    Every 24th sample is a no-template control, as on a CGR plate.
+    """
+    return [('NTC-PC%05d-H-12' if i % 24 == 23 else 'SC%06d') % i for i in range(n_samples)]
+
+
+def write_fastq_pair(r1, r2, sample, n_reads, read_len, rng):
+    """Write a gzipped fastq pair with QIITA-style (non-conformant) headers.
+
+    Roughly 1% of R1 reads are dropped so that fix_unpaired_reads
+    has singletons to find.
+    """
+    qual = 'F' * read_len
+    buf1 = io.StringIO()
+    buf2 = io.StringIO()
+    for i in range(n_reads):
+        tag = 'M05314:89:000000000-BPV43:1:1102:%d:%d' % (rng.randint(1000, 29999), i)
+        head = '@12015.%s_%d %s %%d:N:0:1 orig_bc=TATTGAATATTG new_bc=TATTGAATATTG bc_diffs=0\n' % (sample, i, tag)
+        if rng.random() >= 0.01:
+            buf1.write(head % 1 + ''.join(rng.choice('ACGT') for _ in range(read_len)) + '\n+\n' + qual + '\n')
+        buf2.write(head % 2 + ''.join(rng.choice('ACGT') for _ in range(read_len)) + '\n+\n' + qual + '\n')
+    for path, buf in ((r1, buf1), (r2, buf2)):
+        with gzip.open(path, 'wt', compresslevel=1) as f:
+            f.write(buf.getvalue())
+
+
+def write_inputs(d, n_samples, n_runs, n_reads, read_len, seed):
+    """Lay out fastqs as CGR's CASAVA directories and write both manifests.
+
+    Returns the sample-to-run mapping.
+    """
+    rng = random.Random(seed)
+    runs = run_ids(n_runs)
+    samples = sample_ids(n_samples)
+    mapping = collections.OrderedDict()
+    internal = [MANIFEST_HEADER]
+    external = [MANIFEST_HEADER + ['fq1', 'fq2']]
+    for i, s in enumerate(samples):
+        run = runs[i % n_runs]
+        proj = 'NP0084-MB%d' % (i % 3 + 4)
+        mapping[s] = run
+        p = os.path.join(d, 'fastqs', run, 'CASAVA', 'L1', 'Project_' + proj, 'Sample_' + s)
+        os.makedirs(p)
+        r1 = os.path.join(p, s + '_GCTCGAAGATCG_L001_R1_001.fastq.gz')
+        r2 = os.path.join(p, s + '_GCTCGAAGATCG_L001_R2_001.fastq.gz')
+        write_fastq_pair(r1, r2, s, n_reads, read_len, rng)
+        ntc = s.startswith('NTC')
+        row = [s, 'NTC' if ntc else 'Stool_%d' % i, 'NTC' if ntc else 'Stool', '' if ntc else 'Qiagen',
+               'PC%05d_%s_%02d' % (i // 96, 'ABCDEFGH'[i % 8], i % 12 + 1), run, proj, '0',
+               'NTC' if ntc else 'Study', 'NTC' if ntc else 'IE_Stool', str(i)] + [''] * 12
+        internal.append(row)
+        external.append(row + [r1, r2])
+    for name, rows in (('internal_manifest.txt', internal), ('external_manifest.txt', external)):
+        with open(os.path.join(d, name), 'w') as f:
+            f.write(''.join('\t'.join(r) + '\n' for r in rows))
+    return mapping
+
+
+def write_config(d, name, manifest, data_source):
+    """Write a config.yaml in the same form as tests/blackboxtests.sh."""
+    out = os.path.join(d, 'out_' + name)
+    path = os.path.join(d, name + '.yaml')
+    with open(path, 'w') as f:
+        f.write("metadata_manifest: '" + manifest + "'\n"
+                "out_dir: '" + out + "'\n"
+                "exec_dir: '" + exec_dir + "'\n"
+                "fastq_abs_path: '" + os.path.join(d, 'fastqs') + "'\n"
+                "temp_dir: '" + os.path.join(d, 'tmp') + "'\n"
+                "data_source: '" + data_source + "'\n"
+                "qiime2_version: '2019.1'\n"
+                "dada2_denoise:\n"
+                "  trim_left_forward: 0\n"
+                "  trim_left_reverse: 0\n"
+                "  truncate_length_forward: 0\n"
+                "  truncate_length_reverse: 0\n"
+                "  min_fold_parent_over_abundance: 2.0\n"
+                "phred_score: 33\n"
+                "demux_param: 'paired_end_demux'\n"
+                "input_type: 'SampleData[PairedEndSequencesWithQuality]'\n"
+                "min_num_features_per_sample: 1\n"
+                "min_num_reads_per_sample: 1\n"
+                "min_num_reads_per_feature: 1\n"
+                "min_num_samples_per_feature: 1\n"
+                "sampling_depth: 10000\n"
+                "max_depth: 54000\n"
+                "reference_db:\n"
+                "- '" + os.path.join(d, REF + '.qza') + "'\n"
+                "cluster_mode: 'local'\n"
+                "num_jobs: 1\n"
+                "latency: 1\n")
+    return path, out + '/'
+
+
+def write_artifact(path, files):
+    """Write a QIIME2-style zip: <uuid>/metadata.yaml plus <uuid>/data/<files>."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    u = str(uuid.uuid4())
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(u + '/metadata.yaml', 'uuid: ' + u + '\ntype: synthetic\nformat: synthetic\n')
+        for name, content in files.items():
+            z.writestr(u + '/data/' + name, content)
+
+
+def synthetic_table(samples, n_features, per_sample, rng):
+    """Return {feature: {sample: count}} with per_sample features per sample."""
+    table = collections.defaultdict(dict)
+    features = ['%032x' % rng.getrandbits(128) for _ in range(n_features)]
+    for s in samples:
+        for f in rng.sample(features, min(per_sample, n_features)):
+            table[f][s] = rng.randint(1, 5000)
+    return features, table
+
+
+def taxonomy(features, rng):
+    """Greengenes-style 7-rank lineage per feature, drawn from a small tree."""
+    tax = {}
+    for f in features:
+        node = [rng.randint(0, 3)]
+        for _ in RANKS[1:]:
+            node.append(rng.randint(0, 5))
+        tax[f] = ['%s__T%s' % (r, '_'.join(str(x) for x in node[:i + 1])) for i, r in enumerate(RANKS)]
+    return tax
+
+
+def level_csv(samples, table, tax, level):
+    """Per-level csv in the form of barplots_data_files/level-N.csv."""
+    counts = collections.defaultdict(lambda: collections.defaultdict(int))
+    for f, row in table.items():
+        t = ';'.join(tax[f][:level])
+        for s, c in row.items():
+            counts[s][t] += c
+    taxa = sorted({t for s in counts for t in counts[s]})
+    lines = ['index,' + ','.join(taxa)]
+    for s in samples:
+        lines.append(s + ',' + ','.join(str(counts[s].get(t, 0)) for t in taxa))
+    return '\n'.join(lines) + '\n'
+
+
+def distance_tsv(samples, rng):
+    """Symmetric N x N distance-matrix.tsv as written inside *_dist.qza."""
+    n = len(samples)
+    out = io.StringIO()
+    out.write('\t' + '\t'.join(samples) + '\n')
+    upper = [[rng.random() for _ in range(n)] for _ in range(n)]
+    for i in range(n):
+        out.write(samples[i] + '\t' + '\t'.join(
+            '0.0' if i == j else repr(upper[min(i, j)][max(i, j)]) for j in range(n)) + '\n')
+    return out.getvalue()
+
+
+def write_artifacts(out, mapping, n_features, per_sample, max_dist_samples, seed):
+    """Pre-populate the outputs of the QIIME2 steps that precede each stage."""
+    rng = random.Random(seed)
+    samples = list(mapping)
+    features, table = synthetic_table(samples, n_features, per_sample, rng)
+    runs = sorted(set(mapping.values()))
+    for run in runs:
+        for d in ('feature_tables', 'sequence_tables', 'stats'):
+            write_artifact(out + 'denoising/' + d + '/' + run + '.qza', {'stub.txt': run})
+    write_artifact(out + 'denoising/feature_tables/merged.qza', {'stub.txt': 'merged'})
+    write_artifact(out + 'denoising/sequence_tables/merged.qza', {'stub.txt': 'merged'})
+    os.makedirs(out + 'manifests', exist_ok=True)
+    tax = taxonomy(features, rng)
+    write_artifact(out + 'taxonomic_classification/' + REF + '/synthetic_taxonomy.qza',
+                   {'taxonomy.tsv': 'Feature ID\tTaxon\tConfidence\n' +
+                    ''.join(f + '\t' + '; '.join(tax[f]) + ' \t0.9\n' for f in features)})
+    for tax_dir in ('taxonomic_classification', 'taxonomic_classification_bacteria_only'):
+        d = out + tax_dir + '/' + REF + '/barplots_data_files/'
+        os.makedirs(d, exist_ok=True)
+        for i in range(1, 8):
+            with open(d + 'level-%d.csv' % i, 'w') as f:
+                f.write(level_csv(samples, table, tax, i))
+    dist_samples = samples[:max_dist_samples]
+    for metric in DIST_METRICS:
+        write_artifact(out + 'diversity_core_metrics/' + REF + '/' + metric + '_dist.qza',
+                       {'distance-matrix.tsv': distance_tsv(dist_samples, rng)})
+    return samples, features, table
+
+
+"""Stages"""
+
+
+def snakemake(config, out, targets, cores, extra=None):
+    """Run snakemake with the qiime stub first in $PATH; return wall seconds."""
+    env = dict(os.environ, conf=config, PATH=stub_dir + os.pathsep + os.environ.get('PATH', ''))
+    cmd = ['snakemake', '-s', os.path.join(exec_dir, 'workflow', 'Snakefile'),
+           '-d', out, '--cores', str(cores)] + targets + (extra or [])
+    start = time.monotonic()
+    p = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                       universal_newlines=True)
+    elapsed = time.monotonic() - start
+    if p.returncode != 0:
+        sys.exit('ERROR: ' + ' '.join(cmd) + ' failed:\n' + p.stdout[-4000:])
+    return elapsed
+
+
+def stage_dag(ctx):
+    return snakemake(ctx['internal_config'], ctx['internal_out'], [], 1, ['-n'])
+
+
+def stage_validate(ctx):
+    """Time the load-time manifest validation done by the Snakefile."""
+    sys.path.insert(0, os.path.join(exec_dir, 'workflow', 'scripts'))
+    from Q2Manifest import load_manifest
+    start = time.monotonic()
+    for source in ('internal', 'external'):
+        load_manifest(ctx[source + '_manifest'], source == 'internal')
+    return time.monotonic() - start
+
+
+def stage_manifest(ctx):
+    runs = sorted(set(ctx['mapping'].values()))
+    return snakemake(ctx['internal_config'], ctx['internal_out'],
+                     [ctx['internal_out'] + 'manifests/' + r + '_Q2_manifest.txt' for r in runs],
+                     ctx['cores'])
+
+
+def stage_header_fix(ctx):
+    out = ctx['external_out']
+    return snakemake(ctx['external_config'], out,
+                     [out + 'fastqs/' + s + '_R' + r + '_fixed.fastq.gz'
+                      for s in ctx['mapping'] for r in '12'], ctx['cores'])
+
+
+def stage_pairing(ctx):
+    out = ctx['external_out']
+    return snakemake(ctx['external_config'], out,
+                     [out + 'fastqs/' + s + '_R1_paired.fastq.gz' for s in ctx['mapping']],
+                     ctx['cores'])
+
+
+def ensure_q2_manifest(ctx):
+    """Stand in for check_manifest when the manifest stage was not run."""
+    out = ctx['internal_out']
+    if not os.path.exists(out + 'manifests/manifest_qiime2.tsv'):
+        shutil.copy(os.path.join(os.path.dirname(out.rstrip('/')), 'internal_manifest.txt'),
+                    out + 'manifests/manifest_qiime2.tsv')
+
+
+def stage_merge(ctx):
+    out = ctx['internal_out']
+    ensure_q2_manifest(ctx)
+    for f in ('feature_tables', 'sequence_tables'):
+        os.remove(out + 'denoising/' + f + '/merged.qza')
+    return snakemake(ctx['internal_config'], out,
+                     [out + 'denoising/feature_tables/merged.qza',
+                      out + 'denoising/sequence_tables/merged.qza'], ctx['cores'],
+                     ['--allowed-rules', 'merge_feature_tables', 'merge_sequence_tables'])
+
+
+def stage_filter(ctx):
+    out = ctx['internal_out']
+    ensure_q2_manifest(ctx)
+    return snakemake(ctx['internal_config'], out,
+                     [out + 'read_feature_and_sample_filtering/' + t + '/4_remove_samples_with_low_feature_count.qza'
+                      for t in ('feature_tables', 'sequence_tables')], ctx['cores'],
+                     ['--allowed-rules', 'remove_samples_with_low_read_count',
+                      'remove_features_with_low_read_count', 'remove_features_with_low_sample_count',
+                      'remove_samples_with_low_feature_count', 'apply_filters_to_sequence_tables'])
+
+
+def count_matrix(samples, features, table):
+    """The synthetic table as a features x samples CSR matrix."""
+    from scipy import sparse
+    rows, cols, vals = [], [], []
+    col = {s: j for j, s in enumerate(samples)}
+    for i, f in enumerate(features):
+        for s, c in table.get(f, {}).items():
+            rows.append(i)
+            cols.append(col[s])
+            vals.append(c)
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(len(features), len(samples)), dtype=float)
+
+
+def write_sparse_table(path, samples, features, table):
+    """Write the synthetic table as feature-table.sparse.h5, via a minimal BIOM HDF5 file."""
+    import h5py
+    sys.path.insert(0, os.path.join(exec_dir, 'workflow', 'scripts'))
+    import sparse_feature_table
+    m = count_matrix(samples, features, table)
+    tmp = path + '.biom'
+    with h5py.File(tmp, 'w') as f:
+        for axis, ids, matrix in (('observation', features, m), ('sample', samples, m.T.tocsr())):
+            f.create_dataset(axis + '/ids', data=[i.encode('utf-8') for i in ids])
+            for name in ('data', 'indices', 'indptr'):
+                f.create_dataset(axis + '/matrix/' + name, data=getattr(matrix, name))
+    sparse_feature_table.export(tmp, path)
+    os.remove(tmp)
+
+
+def stage_report_prep(ctx):
+    """Mirror the data loading done in report/CGR_16S_Microbiome_QC_Report.py."""
+    import numpy as np
+    import pandas as pd
+    from scipy.spatial.distance import squareform
+    sys.path.insert(0, os.path.join(exec_dir, 'workflow', 'scripts'))
+    import distance_matrix
+    from sparse_feature_table import SparseFeatureTable
+    out = ctx['internal_out']
+    write_sparse_table(out + 'denoising/feature_tables/feature-table.sparse.h5', *ctx['table'])
+    prefixes = [out + 'diversity_core_metrics/' + REF + '/' + metric + '_dist' for metric in DIST_METRICS]
+    for prefix in prefixes:
+        distance_matrix.export(prefix + '.qza', prefix)
+    start = time.monotonic()
+    for tax_dir in ('taxonomic_classification', 'taxonomic_classification_bacteria_only'):
+        for i in range(1, 8):
+            pd.read_csv(out + tax_dir + '/' + REF + '/barplots_data_files/level-%d.csv' % i, index_col=0)
+    with SparseFeatureTable(out + 'denoising/feature_tables/feature-table.sparse.h5') as t:
+        n_features, n_samples = t.shape
+    for prefix in prefixes:
+        dist = np.load(prefix + distance_matrix.SUFFIX, mmap_mode='r')
+        with open(prefix + distance_matrix.IDS_SUFFIX) as f:
+            sample_ids = f.read().splitlines()
+        assert squareform(dist, checks=False).shape == (len(sample_ids), len(sample_ids))
+    assert n_features > 0
+    return time.monotonic() - start
+
+
+def write_biom_artifact(path, samples, features, table):
+    """Write the synthetic table as a FeatureTable[Frequency] qza (BIOM HDF5)."""
+    import biom
+    m = count_matrix(samples, features, table)
+    tmp = path + '.biom'
+    with biom.util.biom_open(tmp, 'w') as f:
+        biom.Table(m, features, samples).to_hdf5(f, 'scaling benchmark')
+    with open(tmp, 'rb') as f:
+        write_artifact(path, {'feature-table.biom': f.read()})
+    os.remove(tmp)
+
+
+def stage_taxa_collapse(ctx):
+    """Time collapse_taxonomy.py (convert_taxonomy_to_tsv) on the synthetic table."""
+    out = ctx['internal_out']
+    d = out + 'taxonomic_classification/' + REF + '/'
+    write_biom_artifact(d + 'synthetic_table.qza', *ctx['table'])
+    ensure_q2_manifest(ctx)
+    start = time.monotonic()
+    subprocess.check_call([sys.executable, os.path.join(exec_dir, 'workflow', 'scripts', 'collapse_taxonomy.py'),
+                           d + 'synthetic_table.qza', d + 'synthetic_taxonomy.qza',
+                           out + 'manifests/manifest_qiime2.tsv', d + 'collapse_out'])
+    return time.monotonic() - start
+
+
+# stage name -> (function, executables that must be in $PATH, python modules that must import)
+STAGES = collections.OrderedDict([
+    ('dag', (stage_dag, ['snakemake'], [])),
+    ('validate', (stage_validate, [], ['pandas'])),
+    ('manifest', (stage_manifest, ['snakemake', 'dos2unix'], [])),
+    ('header_fix', (stage_header_fix, ['snakemake', 'zcat', 'awk', 'gzip'], [])),
+    ('pairing', (stage_pairing, ['snakemake', 'repair.sh', 'gzip'], [])),
+    ('merge', (stage_merge, ['snakemake'], [])),
+    ('filter', (stage_filter, ['snakemake'], [])),
+    ('taxa_collapse', (stage_taxa_collapse, [], ['biom', 'scipy', 'pandas'])),
+    ('report_prep', (stage_report_prep, [], ['numpy', 'pandas', 'h5py', 'scipy'])),
+])
+
+
+def missing_requirements(tools, modules):
+    missing = [t for t in tools if shutil.which(t) is None]
+    for m in modules:
+        try:
+            __import__(m)
+        except ImportError:
+            missing.append(m)
+    return missing
+
+
+"""Scaling analysis"""
+
+
+def scaling_exponent(points):
+    """Least-squares slope of log(seconds) against log(samples).
+
+    1.0 is linear; 2.0 is quadratic.  Returns None with fewer than
+    two usable points.
+    """
+    pts = [(math.log(n), math.log(max(t, 1e-6))) for n, t in points if n > 0]
+    if len(pts) < 2:
+        return None
+    mx = sum(x for x, _ in pts) / len(pts)
+    my = sum(y for _, y in pts) / len(pts)
+    sxx = sum((x - mx) ** 2 for x, _ in pts)
+    if sxx == 0:
+        return None
+    return sum((x - mx) * (y - my) for x, y in pts) / sxx
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Time pipeline stages on synthetic data of increasing size.')
+    p.add_argument('--sizes', default='10,100,1000,10000',
+                   help='comma-separated sample counts (default: %(default)s)')
+    p.add_argument('--samples-per-run', type=int, default=96,
+                   help='samples per run ID; M = ceil(N / this) (default: %(default)s)')
+    p.add_argument('--runs', type=int, default=None,
+                   help='fixed number of run IDs (overrides --samples-per-run)')
+    p.add_argument('--reads', type=int, default=50, help='read pairs per sample (default: %(default)s)')
+    p.add_argument('--read-length', type=int, default=150, help='default: %(default)s')
+    p.add_argument('--features', type=int, default=2000, help='ASVs in synthetic tables (default: %(default)s)')
+    p.add_argument('--features-per-sample', type=int, default=100, help='default: %(default)s')
+    p.add_argument('--max-dist-samples', type=int, default=2000,
+                   help='cap on samples in synthetic distance matrices (default: %(default)s)')
+    p.add_argument('--stages', default=','.join(STAGES),
+                   help='comma-separated subset of: %(default)s')
+    p.add_argument('--cores', type=int, default=os.cpu_count() or 1, help='snakemake --cores (default: %(default)s)')
+    p.add_argument('--seed', type=int, default=1, help='default: %(default)s')
+    p.add_argument('--work-dir', default=None, help='where synthetic data is written (default: a temp dir)')
+    p.add_argument('--keep', action='store_true', help='keep synthetic data after each size')
+    p.add_argument('--out', default='scaling_benchmark', help='output prefix (default: %(default)s)')
+    p.add_argument('--max-exponent', type=float, default=1.2,
+                   help='flag stages scaling worse than N^x (default: %(default)s)')
+    p.add_argument('--fail-on-superlinear', action='store_true',
+                   help='exit non-zero if any stage exceeds --max-exponent')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+    stages = args.stages.split(',')
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        sys.exit('ERROR: Unknown stage(s): ' + ', '.join(unknown))
+
+    results = []
+    with open(args.out + '.tsv', 'w') as tsv:
+        tsv.write('stage\tn_samples\tn_runs\tseconds\tstatus\n')
+        for n in sizes:
+            n_runs = args.runs or max(1, int(math.ceil(n / float(args.samples_per_run))))
+            d = tempfile.mkdtemp(prefix='q2bench_%d_' % n, dir=args.work_dir)
+            print('Generating %d samples across %d run IDs in %s' % (n, n_runs, d), flush=True)
+            mapping = write_inputs(d, n, n_runs, args.reads, args.read_length, args.seed)
+            open(os.path.join(d, REF + '.qza'), 'w').close()
+            ctx = {'mapping': mapping, 'cores': args.cores}
+            for name, source in (('internal', 'internal'), ('external', 'external')):
+                config, out = write_config(d, name, os.path.join(d, name + '_manifest.txt'), source)
+                ctx[name + '_config'] = config
+                ctx[name + '_manifest'] = os.path.join(d, name + '_manifest.txt')
+                ctx[name + '_out'] = out
+            ctx['table'] = write_artifacts(ctx['internal_out'], mapping, args.features,
+                                           args.features_per_sample, args.max_dist_samples, args.seed)
+            for stage in stages:
+                func, tools, modules = STAGES[stage]
+                missing = missing_requirements(tools, modules)
+                if missing:
+                    status, secs = 'skipped (missing ' + ','.join(missing) + ')', float('nan')
+                else:
+                    status, secs = 'ok', func(ctx)
+                    results.append((stage, n, secs))
+                print('  %-14s %8d samples  %10.3f s  %s' % (stage, n, secs, status), flush=True)
+                tsv.write('%s\t%d\t%d\t%.4f\t%s\n' % (stage, n, n_runs, secs, status))
+                tsv.flush()
+            if not args.keep:
+                shutil.rmtree(d)
+
+    print('\nScaling exponents (time ~ N^x; threshold %.2f):' % args.max_exponent)
+    flagged = []
+    for stage in stages:
+        x = scaling_exponent([(n, t) for s, n, t in results if s == stage])
+        if x is None:
+            print('  %-14s n/a' % stage)
+            continue
+        flag = x > args.max_exponent
+        if flag:
+            flagged.append(stage)
+        print('  %-14s %5.2f%s' % (stage, x, '  SUPERLINEAR' if flag else ''))
+    print('\nResults written to ' + args.out + '.tsv')
+    if flagged and args.fail_on_superlinear:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""Check a manifest for QIIME2 compliance and parse it for the pipeline.
+
+AUTHORS:
+    S. Sevilla Chill
+    W. Zhou
+    B. Ballew
+
+The manifest is read once into a string-typed data frame, and each
+QIIME2 requirement below is evaluated as a column operation over all
+rows at once.  Every violation is collected and reported together, so
+a large LIMS export can be fixed in one pass instead of one error at
+a time.
+
+Manifest requirements checked:
+    - First field of header row must be one of the following:
+        Case insensitive: id, sampleid, sample id, sample-id, featureid,
+            feature id, feature-id
+        Case sensitive: #SampleID, #Sample ID, #OTUID, #OTU ID, sample_name
+    - No empty header fields
+    - No \\, /, *, or ? characters in header fields
+    - No duplicates in header fields
+    - No overlap with allowable sample field labels
+    - No overlap between sample IDs and allowable sample field labels
+    - No empty IDs (note that leading/trailing whitespaces are ignored
+      throughout)
+    - Sample IDs can contain only alphanumerics, period, or dash
+    - Sample IDs must be <= 36 characters
+    - Rows starting with "#" are comments and are ignored (warning)
+    - Missing data must be represented by a blank field, not NA, nan,
+      etc. (warning)
+    - Numeric metadata fields <= 15 chars
+    - At least one line of data
+    - No duplicate sample IDs
+See QIIME documentation and/or keemei.qiime2.org for more details.
+
+The Snakefile imports this module (load_manifest) to validate the
+manifest and build its sample/run ID/project ID mapping at DAG
+construction time, before any jobs are submitted.
+
+TO RUN (standalone):
+    python3 Q2Manifest.py /path/to/manifest.txt
+"""
+
+import io
+import sys
+
+import pandas as pd
+
+SAMPLE_HEADERS_CI = ['id', 'sampleid', 'sample id', 'sample-id', 'featureid', 'feature id', 'feature-id']
+SAMPLE_HEADERS_CS = ['#SampleID', '#Sample ID', '#OTUID', '#OTU ID', 'sample_name']
+
+
+def check_allowed_sample_labels(s):
+    """True where the value is one of the allowed sample ID labels."""
+    return s.str.lower().isin(SAMPLE_HEADERS_CI) | s.isin(SAMPLE_HEADERS_CS)
+
+
+def check_no_duplicates(s):
+    """True where the value has not been seen earlier in the series."""
+    return ~s.duplicated(keep='first')
+
+
+def check_no_empty_fields(s):
+    """True where any non-whitespace character is present."""
+    return s.str.contains(r'\S', regex=True)
+
+
+def check_header_reqs(s):
+    """True where no prohibited characters are present.
+
+    QIIME documentation for 2017.11 states "cannot contain certain
+    special characters (e.g. /, \\, *, ?, etc.)".  We don't know what
+    "etc" includes, so just checking for the explicitly listed chars.
+    """
+    return ~s.str.contains(r'[/\\*?]', regex=True)
+
+
+def check_sample_id_chars(s):
+    """True where the sample ID has only allowed chars."""
+    return s.str.match(r'^\s*[A-Za-z0-9.\-]+\s*$')
+
+
+def check_sample_id_len(s):
+    """True where the sample ID isn't too long."""
+    return s.str.len() <= 36
+
+
+def check_metadata_missing(s):
+    """True where the value is not an NA/nan token."""
+    return ~s.str.lower().str.match(r'^\s*(nan|na)\s*$')
+
+
+def check_metadata_len(s):
+    """True where the value is non-numeric or a numeric of <= 15 chars."""
+    return ~(s.str.match(r'^\s*[0-9.,Ee\-+]+\s*$') & (s.str.len() > 15))
+
+
+def _labels():
+    return ('Case insensitive: ' + ', '.join(SAMPLE_HEADERS_CI) +
+            '; case sensitive: ' + ', '.join(SAMPLE_HEADERS_CS))
+
+
+def read_manifest(path):
+    """Read a tab-delimited manifest into (header, data frame).
+
+    All fields are kept as strings, exactly as written (no NA
+    conversion, no whitespace stripping).  Ragged rows are padded with
+    empty strings.  The frame index is the 1-based data row number and
+    includes blank rows so that messages can point at the right line.
+    """
+    with io.open(path, encoding='utf-8') as f:
+        text = f.read()
+    if not text.strip():
+        sys.exit('ERROR: ' + path + ' is not readable or contains no data.')
+    first, _, body = text.partition('\n')
+    header = first.rstrip('\r').split('\t')
+    width = max([len(header)] + [line.count('\t') + 1 for line in body.splitlines()])
+    if body.strip('\r\n'):
+        df = pd.read_csv(io.StringIO(body), sep='\t', header=None, names=range(width), dtype=str,
+                         na_filter=False, keep_default_na=False, skip_blank_lines=False, quoting=3)
+    else:
+        df = pd.DataFrame(columns=range(width), dtype=str)
+    df.index = range(1, len(df) + 1)
+    return header, df
+
+
+def validate(header, df):
+    """Apply all QIIME2 manifest requirements.
+
+    Returns (errors, warnings, data), where data is the frame with
+    blank and comment rows removed.
+    """
+    errors = []
+    warnings = []
+
+    # HEADER CHECKS:
+    if not check_allowed_sample_labels(pd.Series(header[:1])).all():
+        errors.append('ERROR: First field of header line must be one of the following: ' + _labels())
+    h = pd.Series(header[1:], index=range(1, len(header)))
+    for i in h.index[~check_no_empty_fields(h)]:
+        errors.append('ERROR: Empty header field detected in column %d.' % i)
+    for v in h[~check_header_reqs(h)]:
+        errors.append('ERROR: Prohibited character detected in header "%s".' % v)
+    for v in h[~check_no_duplicates(h)]:
+        errors.append('ERROR: Duplicate values "%s" detected in header.' % v)
+    for v in h[check_allowed_sample_labels(h)]:
+        errors.append('ERROR: "%s" prohibited.  Except for the first field, headers may not include: %s' % (v, _labels()))
+
+    # SAMPLE AND METADATA CHECKS:
+    df = df[df.apply(check_no_empty_fields).any(axis=1)]
+    ids = df[0]
+    comments = ids.str.startswith('#')
+    if comments.any():
+        warnings.append('WARNING: Rows starting with the pound sign (#) will be ignored.')
+    df = df[~comments]
+    ids = df[0]
+    for v in ids[check_allowed_sample_labels(ids)]:
+        errors.append('ERROR: "%s" prohibited.  Sample IDs may not include: %s' % (v, _labels()))
+    for j in ids.index[~check_no_empty_fields(ids)]:
+        errors.append('ERROR: Empty sample ID field detected in row %d.' % j)
+    ids_present = ids[check_no_empty_fields(ids)]
+    for v in ids_present[~check_sample_id_chars(ids_present)]:
+        errors.append('ERROR: Sample ID "%s" contains prohibited characters.' % v)
+    for v in ids[~check_sample_id_len(ids)]:
+        errors.append('ERROR: Sample ID "%s" is longer than 36 characters.' % v)
+    meta = df.iloc[:, 1:].stack() if df.shape[1] > 1 else pd.Series([], dtype=str)
+    for v in pd.unique(meta[~check_metadata_missing(meta)]):
+        warnings.append('WARNING: Missing data must be represented as a blank field, not "%s".' % v)
+    for v in meta[~check_metadata_len(meta)]:
+        errors.append('ERROR: "%s" too long.  Numeric metadata fields must have 15 or fewer characters.' % v)
+
+    # ROW CHECKS:
+    if df.empty:
+        errors.append('ERROR: No non-empty data lines detected.')
+    for v in pd.unique(ids[~check_no_duplicates(ids)]):
+        errors.append('ERROR: Duplicate sample IDs "%s" detected.' % v)
+    return errors, warnings, df
+
+
+def load_manifest(path, cgr_data):
+    """Validate the manifest and return (sampleDict, RUN_IDS) for the Snakefile.
+
+    sampleDict maps sample ID to (Run-ID, Project-ID) for internal data,
+    or (Run-ID, Project-ID, fq1, fq2) for external data.  All problems
+    are printed to stderr before exiting, so they can be fixed at once.
+    """
+    header, df = read_manifest(path)
+    errors, warnings, df = validate(header, df)
+    required = ['Run-ID', 'Project-ID'] if cgr_data else ['Run-ID', 'Project-ID', 'fq1', 'fq2']
+    if not set(required).issubset(header):
+        if cgr_data:
+            errors.insert(0, 'ERROR: Manifest file ' + path + ' must contain headers Run-ID and Project-ID')
+        else:
+            errors.insert(0, 'ERROR: Manifest file ' + path + ' must contain headers Run-ID, Project-ID, fq1, and fq2')
+    for w in warnings:
+        print(w, file=sys.stderr)
+    if errors:
+        sys.exit('\n'.join(errors))
+    df = df.apply(lambda col: col.str.strip())
+    values = zip(*[df[header.index(c)] for c in required])
+    sampleDict = dict(zip(df[0], values))
+    RUN_IDS = list(pd.unique(df[header.index('Run-ID')]))
+    return sampleDict, RUN_IDS
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit('Usage: ' + sys.argv[0] + ' /path/to/manifest.txt')
+    header, df = read_manifest(sys.argv[1])
+    errors, warnings, _ = validate(header, df)
+    for w in warnings:
+        print(w, file=sys.stderr)
+    if errors:
+        sys.exit('\n'.join(errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,7 @@
 #     B. Ballew
 # 
 # TO RUN:
-#     Have perl and conda in $PATH
+#     Have conda in $PATH
 #     Have QIIME2 conda environment set up as in Q2 docs
 #     Copy config.yaml to local dir and edit as needed
 #     Submit this script to a cluster or run locally
@@ -23,7 +23,7 @@ set -euo pipefail
 
 unset module
 
-usage="Usage: $0 /path/to/config.yaml"
+usage="Usage: $0 /path/to/config.yaml [/path/to/another/config.yaml ...]"
 
 # custom exit function
 die() {
@@ -39,16 +39,26 @@ else
     config_file=$1
 fi
 
-if [ ! -f "$config_file" ]; then
-    die "Config file not found.
+for f in "$@"; do
+    if [ ! -f "$f" ]; then
+        die "Config file ${f} not found.
 $usage"
-fi
+    fi
+done
+# with more than one config, run them as one batch (see workflow/scripts/batch.py);
+# environment, cluster settings, job budget and logs come from the first config
 
 # note that this will only work for simple, single-level yaml
 # and requires a whitespace between the key and value pair in the config
 # (except for the cluster command, which requires single or double quotes)
 exec_dir=$(awk '($0~/^exec_dir/){print $2}' "$config_file" | sed "s/['\"]//g")
 out_dir=$(awk '($0~/^out_dir/){print $2}' "$config_file" | sed "s/['\"]//g") 
+pilot=$(awk '($0~/^pilot:/){print $2}' "$config_file" | sed "s/['\"]//g")
+if [ "$pilot" = "True" ] || [ "$pilot" = "true" ]; then
+    # pilot runs log and trace under their own out_dir, as in the Snakefile
+    pilot_out_dir=$(awk '($0~/^pilot_out_dir/){print $2}' "$config_file" | sed "s/['\"]//g")
+    out_dir="${pilot_out_dir:-${out_dir%/}/pilot/}"
+fi
 log_dir="${out_dir}/logs/"
 temp_dir=$(awk '($0~/^temp_dir/){print $2}' "$config_file" | sed "s/['\"]//g")
 num_jobs=$(awk '($0~/^num_jobs/){print $2}' "$config_file" | sed "s/['\"]//g")
@@ -57,6 +67,8 @@ cluster_line=$(awk '($0~/^cluster_mode/){print $0}' "$config_file" | sed "s/\"/'
     # allows single or double quoting of the qsub command in the config file
 cluster_mode='"'$(echo "$cluster_line" | awk -F\' '($0~/^cluster_mode/){print $2}')'"'
 qiime2_version=$(awk '($0~/^qiime2_version/){print $2}' "$config_file" | sed "s/['\"]//g")
+trace=$(awk '($0~/^trace:/){print $2}' "$config_file" | sed "s/['\"]//g")
+watch=$(awk '($0~/^watch:/){print $2}' "$config_file" | sed "s/['\"]//g")
 
 # only allow tested and confirmed versions of Q2
 if [ "$qiime2_version" != "2017.11" ] && [ "$qiime2_version" != "2019.1" ]; then
@@ -75,7 +87,6 @@ fi
 # check dependencies and print to stdout
 echo "Dependencies:"
 conda --version 2> /dev/null || die "conda not detected."
-perl --version 2> /dev/null | head -n2 | tail -n1 || die "Perl not detected."
 python --version 2> /dev/null || die "Python not detected."
 printf "Snakemake: " 
 snakemake --version 2> /dev/null || die "Snakemake not detected."
@@ -106,14 +117,30 @@ fi
 DATE=$(date +"%Y%m%d%H%M")
 
 cmd=""
+snake=""
 if [ "$cluster_mode" = '"'"local"'"' ]; then
-    cmd="conf=$config_file snakemake -p -s ${exec_dir}/workflow/Snakefile --rerun-incomplete &> ${log_dir}/Q2_${DATE}.out"
+    snake="snakemake -p -s ${exec_dir}/workflow/Snakefile --rerun-incomplete"
 elif [ "$cluster_mode" = '"'"unlock"'"' ]; then
     cmd="conf=$config_file snakemake -p -s ${exec_dir}/workflow/Snakefile --unlock"  # convenience unlock
 elif [ "$cluster_mode" = '"'"dryrun"'"' ]; then  
     cmd="conf=$config_file snakemake -n -p -s ${exec_dir}/workflow/Snakefile"  # convenience dry run
 else
-    cmd="conf=$config_file snakemake -p -s ${exec_dir}/workflow/Snakefile --rerun-incomplete --cluster ${cluster_mode} --jobs $num_jobs --latency-wait ${latency} &> ${log_dir}/Q2_${DATE}.out"
+    if [ "$trace" = "True" ] || [ "$trace" = "true" ]; then
+        # record when each job is handed to the scheduler, for the run timeline
+        cluster_mode='"'"python ${exec_dir}/workflow/scripts/timeline.py submit ${out_dir}/run_times/trace/ "${cluster_mode:1}
+    fi
+    snake="snakemake -p -s ${exec_dir}/workflow/Snakefile --rerun-incomplete --cluster ${cluster_mode} --default-resources mem_mb=8000 runtime=1440 --jobs $num_jobs --latency-wait ${latency}"
+fi
+if [ -n "$snake" ]; then
+    if [ $# -gt 1 ]; then
+        # share per-run denoising and classification across the projects
+        cmd="python ${exec_dir}/workflow/scripts/batch.py --snakemake '$snake' --jobs ${num_jobs:-10} $* &> ${log_dir}/Q2_batch_${DATE}.out"
+    elif [ "$watch" = "True" ] || [ "$watch" = "true" ]; then
+        # start each run ID as its fastqs land, then the cross-run stages
+        cmd="conf=$config_file python ${exec_dir}/workflow/scripts/watch_runs.py --jobs ${num_jobs:-10} $config_file '$snake' &> ${log_dir}/Q2_${DATE}.out"
+    else
+        cmd="conf=$config_file $snake &> ${log_dir}/Q2_${DATE}.out"
+    fi
 fi
 
 echo "Command run: $cmd"
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+"""Run several projects as one batch, sharing per-run and reference-bound work.
+
+AUTHORS:
+    B. Ballew
+
+Projects launched together often share flowcells and always share the
+reference_db classifiers, but separate Q2_wrapper.sh runs denoise the
+same run IDs and load the same classifiers once each, while competing
+for the queue.  Given several config.yaml files (Q2_wrapper.sh with
+more than one config), this runs them in phases under one global job
+budget:
+
+    1. per-run stages: each distinct run ID (same fastqs, DADA2
+       parameters and QIIME2 version) is denoised once, by the first
+       project that lists it (target rule per_run),
+    2. every project up to its classification input; the other
+       projects' DADA2 jobs for shared run IDs are DADA2 cache hits,
+    3. one classify-sklearn job per classifier over the union of all
+       projects' features not yet in the taxonomy cache
+       (workflow/Snakefile_batch),
+    4. every project's full workflow; classification assembles each
+       project's taxonomy from the cache.
+
+Invocations within a phase run concurrently and split the global
+--jobs budget between them.  All projects share one DADA2 cache and
+one taxonomy cache: the first project's dada2_cache_dir and
+taxonomy_cache_dir if set, otherwise <batch_dir>/dada2_cache/ and
+<batch_dir>/taxonomy_cache/.  Outputs in each out_dir have the same
+contents as a standalone run (cached artifacts keep the provenance of
+the run that produced them).  Snakemake output goes to
+<out_dir>/logs/Q2_batch_<date>.out for each project.
+
+TO RUN (normally via Q2_wrapper.sh):
+    python3 batch.py --snakemake 'snakemake -p -s /path/to/Snakefile ...' --jobs 20 a/config.yaml b/config.yaml
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import yaml
+
+from Q2Manifest import load_manifest
+from watch_runs import pipeline_out_dir, run_fastqs
+
+CACHES = ['dada2_cache_dir', 'taxonomy_cache_dir']
+
+
+def load_project(path):
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    cgr_data = config['data_source'] == 'internal'
+    sample_dict, run_ids = load_manifest(config['metadata_manifest'], cgr_data)
+    return {'config_file': os.path.abspath(path), 'config': config, 'cgr_data': cgr_data,
+            'out_dir': pipeline_out_dir(config), 'samples': sample_dict, 'run_ids': run_ids}
+
+
+def check_projects(projects):
+    """Exit if the configs cannot be run as one batch."""
+    errors = []
+    for key in ('exec_dir', 'qiime2_version'):
+        values = set(str(p['config'][key]).rstrip('/') for p in projects)
+        if len(values) > 1:
+            errors.append('ERROR: all configs in a batch need the same %s (found %s)' % (key, ', '.join(sorted(values))))
+    out_dirs = [p['out_dir'] for p in projects]
+    if len(set(out_dirs)) < len(out_dirs):
+        errors.append('ERROR: each config in a batch needs its own out_dir')
+    if errors:
+        sys.exit('\n'.join(errors))
+
+
+def shared_caches(projects, batch_dir):
+    """Cache directories used by every project in the batch."""
+    caches = {}
+    for key in CACHES:
+        set_dirs = [p['config'].get(key) for p in projects if p['config'].get(key)]
+        caches[key] = set_dirs[0] if set_dirs else batch_dir + key[:-len('_dir')] + '/'
+        for d in set(set_dirs[1:]) - {caches[key]}:
+            print('WARNING: %s %s is replaced by %s for this batch' % (key, d, caches[key]))
+    return caches
+
+
+def run_signature(project, run_id):
+    """What makes one project's DADA2 results for run_id the same as another's."""
+    c = project['config']
+    fastq_abs_path = c['fastq_abs_path'].rstrip('/') + '/' if project['cgr_data'] else ''
+    samples = {s: v for s, v in project['samples'].items() if v[0] == run_id}
+    sig = {'run_id': run_id,
+           'fastqs': sorted(run_fastqs(samples, project['cgr_data'], fastq_abs_path)[run_id]),
+           'dada2_denoise': c['dada2_denoise'],
+           'qiime2_version': str(c['qiime2_version']),
+           'phred_score': c.get('phred_score'),
+           'input_type': c.get('input_type'),
+           'pilot': [c.get(k) for k in ('pilot', 'pilot_reads', 'pilot_fraction', 'pilot_seed')]}
+    if c.get('quality_profile') == 'apply':
+        sig['quality_criteria'] = c.get('quality_criteria')
+    return json.dumps(sig, sort_keys=True, default=str)
+
+
+def plan_runs(projects):
+    """Run IDs each project denoises itself: those no earlier project has."""
+    owner = {}
+    owned = []
+    for i, p in enumerate(projects):
+        mine = []
+        for r in p['run_ids']:
+            sig = run_signature(p, r)
+            if sig not in owner:
+                owner[sig] = i
+                mine.append(r)
+        owned.append(mine)
+    return owned
+
+
+def classification_seqs(project):
+    """Representative sequences that taxonomic_classification reads."""
+    if str(project['config']['qiime2_version']) == '2017.11':
+        return project['out_dir'] + 'denoising/sequence_tables/merged.qza'
+    return project['out_dir'] + 'read_feature_and_sample_filtering/sequence_tables/4_remove_samples_with_low_feature_count.qza'
+
+
+def fastq_bytes(projects):
+    """Total size of the distinct source fastqs of all projects, for sizing the classification jobs."""
+    files = set()
+    for p in projects:
+        fastq_abs_path = p['config']['fastq_abs_path'].rstrip('/') + '/' if p['cgr_data'] else ''
+        for patterns in run_fastqs(p['samples'], p['cgr_data'], fastq_abs_path).values():
+            for pattern in patterns:
+                files.update(os.path.abspath(f) for f in glob.glob(pattern))
+    return sum(os.path.getsize(f) for f in files)
+
+
+def batch_classification_config(projects, batch_dir, caches):
+    """Config for Snakefile_batch: every classifier and the sequences to classify against it.
+
+    Jobs are sized with the first project's resource_history and
+    resource_limits, as its taxonomic_classification jobs would be.
+    """
+    refs, seqs = {}, {}
+    for p in projects:
+        for path in p['config']['reference_db']:
+            name = os.path.splitext(os.path.basename(path))[0]
+            while name in refs and refs[name] != path:
+                name += '_'
+            refs[name] = path
+            seqs.setdefault(name, []).append(classification_seqs(p))
+    first = projects[0]
+    return {'batch_dir': batch_dir, 'taxonomy_cache_dir': caches['taxonomy_cache_dir'],
+            'qiime2_version': str(first['config']['qiime2_version']), 'refs': refs, 'seqs': seqs,
+            'fastq_bytes': fastq_bytes(projects),
+            'resource_history': (first['config'].get('resource_history') or
+                                 first['out_dir'] + 'run_times/resource_history.tsv'),
+            'resource_limits': first['config'].get('resource_limits') or {}}
+
+
+def snakemake_command(snakemake, jobs, config=None, targets=()):
+    """snakemake plus --jobs, --config and targets; later --jobs and -s options override earlier ones."""
+    cmd = snakemake + ' --jobs %d' % jobs
+    if config:
+        cmd += ' --config ' + ' '.join('%s=%s' % kv for kv in sorted(config.items()))
+    if targets:
+        cmd += ' -- ' + ' '.join(targets)
+    return cmd
+
+
+def run_phase(name, invocations, jobs):
+    """Run invocations concurrently, splitting jobs between them; return the labels of those that failed.
+
+    Each invocation is (label, command(jobs) -> command line, env, log).
+    """
+    if not invocations:
+        return []
+    share = max(1, jobs // len(invocations))
+    print('%s: %d invocation(s), %d jobs each' % (name, len(invocations), share), flush=True)
+    procs = []
+    for label, command, env, log in invocations:
+        cmd = command(share)
+        with open(log, 'a') as f:
+            f.write('\n### batch %s: %s\n' % (name, cmd))
+            f.flush()
+            procs.append((label, log, subprocess.Popen(cmd, shell=True, env=env, stdout=f, stderr=subprocess.STDOUT)))
+    failed = []
+    for label, log, proc in procs:
+        if proc.wait():
+            failed.append(label)
+            print('%s: %s FAILED (exit %d); see %s' % (name, label, proc.returncode, log), flush=True)
+    return failed
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Run several project configs as one batch.')
+    p.add_argument('configs', nargs='+', help='project config.yaml files')
+    p.add_argument('--snakemake', required=True, help='snakemake command line, without targets')
+    p.add_argument('--jobs', type=int, default=10, help='global job budget (default: %(default)s)')
+    p.add_argument('--batch-dir', help='where batch records and default caches go (default: <first out_dir>/batch/)')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    projects = [load_project(c) for c in args.configs]
+    check_projects(projects)
+    batch_dir = (args.batch_dir or projects[0]['out_dir'] + 'batch/').rstrip('/') + '/'
+    os.makedirs(batch_dir, exist_ok=True)
+    caches = shared_caches(projects, batch_dir)
+    stamp = time.strftime('%Y%m%d%H%M')
+    logs = []
+    for p in projects:
+        os.makedirs(p['out_dir'] + 'logs/', exist_ok=True)
+        logs.append(p['out_dir'] + 'logs/Q2_batch_' + stamp + '.out')
+
+    def invocation(i, extra_config=None, targets=()):
+        p = projects[i]
+        config = dict(caches, **(extra_config or {}))
+        return (p['config_file'], lambda jobs: snakemake_command(args.snakemake, jobs, config, targets),
+                dict(os.environ, conf=p['config_file']), logs[i])
+
+    owned = plan_runs(projects)
+    for p, mine in zip(projects, owned):
+        shared = len(p['run_ids']) - len(mine)
+        print('%s: %d run IDs, %d denoised by an earlier project' % (p['config_file'], len(p['run_ids']), shared))
+    phases = [
+        ('per-run stages', [invocation(i, {'only_run_ids': ','.join(mine)}, ['per_run'])
+                            for i, mine in enumerate(owned) if mine]),
+        ('up to classification', [invocation(i, targets=[classification_seqs(p)]) for i, p in enumerate(projects)]),
+    ]
+    for name, invocations in phases:
+        if run_phase(name, invocations, args.jobs):
+            sys.exit('ERROR: batch stopped in phase "%s"' % name)
+
+    with open(batch_dir + 'batch_config.yaml', 'w') as f:
+        yaml.safe_dump(batch_classification_config(projects, batch_dir, caches), f, default_flow_style=False)
+    snakefile = os.path.join(str(projects[0]['config']['exec_dir']), 'workflow', 'Snakefile_batch')
+    batch_cmd = args.snakemake + ' -s ' + snakefile + ' --configfile ' + batch_dir + 'batch_config.yaml'
+    if run_phase('shared classification', [('classification', lambda jobs: snakemake_command(batch_cmd, jobs),
+                                            dict(os.environ),
+                                            batch_dir + 'Q2_batch_' + stamp + '.out')], args.jobs):
+        sys.exit('ERROR: batch stopped in phase "shared classification"')
+
+    failed = run_phase('full workflows', [invocation(i) for i in range(len(projects))], args.jobs)
+    if failed:
+        sys.exit('ERROR: failed projects: ' + ', '.join(failed))
+    print('Batch complete', flush=True)
+
+
+if __name__ == '__main__':
+    main()
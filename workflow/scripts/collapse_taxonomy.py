@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""Collapse a feature table to every taxonomic level in one pass.
+
+AUTHORS:
+    B. Ballew
+
+Replaces the `qiime taxa barplot` + unzip route to per-level abundance
+tables.  The feature table is joined with the taxonomy once; then,
+for each level, a sparse taxa x features indicator matrix (1 where a
+feature's lineage truncated to that level is the taxon) is multiplied
+by the sparse features x samples table.  Lineages are split, stripped
+and padded with "__" exactly as q2-taxa does, so level-N.csv matches
+the CSVs inside barplots.qzv (taxa columns are sorted here; QIIME's
+order is arbitrary).
+
+INPUT:
+    - FeatureTable[Frequency] qza
+    - FeatureData[Taxonomy] qza (trailing whitespace in Taxon is
+      stripped in memory)
+    - QIIME2 manifest (metadata columns are appended to the CSVs as
+      in barplots.qzv)
+
+OUTPUT (in --out-dir):
+    - level-1.csv ... level-N.csv
+    - taxonomy.tsv (whitespace-normalized)
+    - collapsed_taxa.npz: per level, the samples x taxa counts as CSR
+      arrays (level_N_data, level_N_indices, level_N_indptr) with
+      level_N_taxa, plus sample_ids; see load_level()
+
+TO RUN:
+    python3 collapse_taxonomy.py table.qza taxonomy.qza manifest.tsv out_dir/
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from q2_artifacts import load_biom, load_taxonomy
+
+
+def lineages(taxa, n_levels):
+    """Split, strip and pad each Taxon string to n_levels ranks.
+
+    Returns a features x n_levels array of cumulative lineage strings,
+    i.e. column L-1 holds the ';'-joined lineage truncated to level L.
+    """
+    split = taxa.str.split(';').apply(lambda l: [x.strip() for x in l])
+    n_levels = max(n_levels, split.str.len().max())
+    padded = split.apply(lambda l: l + ['__'] * (n_levels - len(l)))
+    ranks = np.array(padded.tolist(), dtype=object)
+    out = ranks.copy()
+    for i in range(1, n_levels):
+        out[:, i] = out[:, i - 1] + ';' + ranks[:, i]
+    return out
+
+
+def collapse(matrix, lineage):
+    """Sum rows of a features x samples sparse matrix by lineage.
+
+    Returns (taxa, taxa x samples CSR matrix), taxa sorted.
+    """
+    taxa, codes = np.unique(lineage, return_inverse=True)
+    indicator = sparse.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                                  shape=(len(taxa), len(codes)))
+    return taxa, (indicator @ matrix).tocsr()
+
+
+def collapse_all(table, taxonomy, n_levels=7):
+    """Collapse a biom Table to levels 1..n with a taxonomy frame.
+
+    Features without a taxonomy assignment are dropped, as in q2-taxa.
+    Returns (sample_ids, [(taxa, samples x taxa CSR matrix), ...]).
+    """
+    features = table.ids(axis='observation')
+    keep = np.isin(features, taxonomy.index)
+    matrix = table.matrix_data.tocsr()[keep]
+    lineage = lineages(taxonomy.loc[features[keep], 'Taxon'], n_levels)
+    levels = []
+    for i in range(lineage.shape[1]):
+        taxa, m = collapse(matrix, lineage[:, i])
+        levels.append((taxa, m.T.tocsr()))
+    return table.ids(axis='sample'), levels
+
+
+def save_npz(path, sample_ids, levels):
+    arrays = {'sample_ids': np.asarray(sample_ids, dtype=str)}
+    for i, (taxa, m) in enumerate(levels, 1):
+        arrays['level_%d_taxa' % i] = np.asarray(taxa, dtype=str)
+        arrays['level_%d_data' % i] = m.data
+        arrays['level_%d_indices' % i] = m.indices
+        arrays['level_%d_indptr' % i] = m.indptr
+    np.savez_compressed(path, **arrays)
+
+
+def load_level(path, level, dense=True):
+    """Read one level from collapsed_taxa.npz.
+
+    Returns a samples x taxa data frame, or (sample_ids, taxa, CSR
+    matrix) with dense=False.
+    """
+    with np.load(path) as z:
+        samples = z['sample_ids']
+        taxa = z['level_%d_taxa' % level]
+        m = sparse.csr_matrix((z['level_%d_data' % level], z['level_%d_indices' % level],
+                               z['level_%d_indptr' % level]), shape=(len(samples), len(taxa)))
+    if not dense:
+        return samples, taxa, m
+    return pd.DataFrame(m.toarray(), index=samples, columns=taxa)
+
+
+def write_level_csv(path, sample_ids, taxa, m, metadata):
+    """Write a barplots.qzv-style level-N.csv (counts, then metadata columns)."""
+    df = pd.DataFrame(m.toarray(), index=pd.Index(sample_ids, name='index'), columns=taxa)
+    if metadata is not None:
+        df = df.join(metadata, how='left')
+    df.to_csv(path)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Collapse a feature table to all taxonomic levels.')
+    p.add_argument('table', help='FeatureTable[Frequency] qza')
+    p.add_argument('taxonomy', help='FeatureData[Taxonomy] qza')
+    p.add_argument('metadata', help='QIIME2 manifest (tab-delimited, sample IDs in first column)')
+    p.add_argument('out_dir')
+    p.add_argument('--levels', type=int, default=7, help='minimum number of levels (default: %(default)s)')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    taxonomy = load_taxonomy(args.taxonomy)
+    sample_ids, levels = collapse_all(load_biom(args.table), taxonomy, args.levels)
+    metadata = pd.read_csv(args.metadata, sep='\t', index_col=0, dtype=str, comment=None)
+    metadata = metadata[~metadata.index.astype(str).str.startswith('#')]
+    os.makedirs(args.out_dir, exist_ok=True)
+    taxonomy.to_csv(os.path.join(args.out_dir, 'taxonomy.tsv'), sep='\t')
+    for i, (taxa, m) in enumerate(levels, 1):
+        write_level_csv(os.path.join(args.out_dir, 'level-%d.csv' % i), sample_ids, taxa, m, metadata)
+    save_npz(os.path.join(args.out_dir, 'collapsed_taxa.npz'), sample_ids, levels)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""Content-addressed cache for per-run ID DADA2 results.
+
+AUTHORS:
+    B. Ballew
+
+The same flowcells are regularly re-analyzed under new project
+manifests (extra samples elsewhere, a different reference_db, changed
+filter thresholds), and dada2_denoise re-runs every time even though
+its own inputs have not changed.  Results are cached under a key
+built from:
+    - the decompressed contents of every FASTQ in the run's QIIME2
+      manifest (so re-gzipping or moving files does not miss),
+    - the sample-to-run mapping (run ID, sample IDs, read directions),
+    - the dada2_denoise parameters, the import settings (phred_score,
+      input_type) and QIIME2 version.
+The import_and_demultiplex qza itself is not hashed; it embeds UUIDs
+and timestamps that differ on every import.
+
+Layout:
+    <cache_dir>/<key[:2]>/<key>/<output name>.qza
+    <cache_dir>/<key[:2]>/<key>/entry.json   run ID, params, size, times
+Entries are written to a temp dir and renamed into place, so a partly
+written entry is never visible.  On a hit, outputs are hardlinked into
+out_dir (copied if the cache is on another filesystem).  When the cache
+exceeds its size limit, least recently used entries are removed.
+
+Note that QIIME2 provenance inside a cached artifact refers to the run
+that first produced it.
+"""
+
+import contextlib
+import csv
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK = 1 << 20
+
+
+def fastq_digest(path):
+    """sha256 of the decompressed contents of a (gzipped) fastq."""
+    h = hashlib.sha256()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_q2_manifest(path):
+    """Return [(sample-id, absolute-filepath, direction), ...] from a per-run QIIME2 manifest."""
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    return [tuple(r[:3]) for r in rows[1:] if r]
+
+
+def cache_key(run_id, manifest, params, threads=1):
+    """Hash of fastq contents, sample-to-run mapping and parameters."""
+    rows = sorted(read_q2_manifest(manifest))
+    with ThreadPoolExecutor(max(1, threads)) as pool:
+        digests = list(pool.map(fastq_digest, [r[1] for r in rows]))
+    h = hashlib.sha256()
+    h.update(json.dumps({'run_id': run_id,
+                         'params': params,
+                         'fastqs': [[s, d, x] for (s, _, d), x in zip(rows, digests)]},
+                        sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _place(src, dst):
+    """Hardlink src to dst, falling back to a copy across filesystems."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return 'linked'
+    except OSError:
+        shutil.copy2(src, dst)
+        return 'copied'
+
+
+def _size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def _entries(cache_dir):
+    for prefix in os.listdir(cache_dir):
+        p = os.path.join(cache_dir, prefix)
+        if len(prefix) != 2 or not os.path.isdir(p):
+            continue
+        for key in os.listdir(p):
+            if not key.startswith('.'):
+                yield os.path.join(p, key)
+
+
+@contextlib.contextmanager
+def _locked(cache_dir):
+    with open(os.path.join(cache_dir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class Dada2Cache(object):
+    """A DADA2 result cache rooted at cache_dir, capped at max_bytes (None for no cap)."""
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, outputs):
+        """Materialize outputs ({name: path}) from the cache.
+
+        Returns 'linked' or 'copied' on a hit, None on a miss.
+        """
+        e = self.entry(key)
+        with _locked(self.cache_dir):
+            if not all(os.path.exists(os.path.join(e, n + '.qza')) for n in outputs):
+                return None
+            how = set(_place(os.path.join(e, n + '.qza'), p) for n, p in outputs.items())
+            meta = self._meta(e)
+            meta['last_used'] = time.time()
+            meta['hits'] = meta.get('hits', 0) + 1
+            self._write_meta(e, meta)
+        return 'copied' if 'copied' in how else 'linked'
+
+    def store(self, key, outputs, meta):
+        """Add outputs to the cache, then evict down to max_bytes.
+
+        Returns the list of evicted entry directories.
+        """
+        e = self.entry(key)
+        os.makedirs(os.path.dirname(e), exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.' + key, dir=os.path.dirname(e))
+        for n, p in outputs.items():
+            _place(p, os.path.join(tmp, n + '.qza'))
+        now = time.time()
+        meta = dict(meta, created=now, last_used=now, hits=0, bytes=_size(tmp))
+        self._write_meta(tmp, meta)
+        with _locked(self.cache_dir):
+            if os.path.exists(e):
+                shutil.rmtree(tmp)
+            else:
+                os.rename(tmp, e)
+            return self._evict(keep=e)
+
+    def usage(self):
+        """(number of entries, total bytes)."""
+        sizes = [self._meta(e).get('bytes', 0) for e in _entries(self.cache_dir)]
+        return len(sizes), sum(sizes)
+
+    def _evict(self, keep):
+        if self.max_bytes is None:
+            return []
+        entries = sorted(_entries(self.cache_dir), key=lambda e: self._meta(e).get('last_used', 0))
+        total = sum(self._meta(e).get('bytes', 0) for e in entries)
+        evicted = []
+        for e in entries:
+            if total <= self.max_bytes:
+                break
+            if e == keep:
+                continue
+            total -= self._meta(e).get('bytes', 0)
+            shutil.rmtree(e)
+            evicted.append(e)
+        return evicted
+
+    @staticmethod
+    def _meta(e):
+        try:
+            with open(os.path.join(e, 'entry.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_meta(e, meta):
+        with open(os.path.join(e, 'entry.json.tmp'), 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        os.replace(os.path.join(e, 'entry.json.tmp'), os.path.join(e, 'entry.json'))
+
+
+def gb(n):
+    return '%.2f GB' % (n / 1e9)
+
+
+def fetch_cached(cache, key, run_id, outputs):
+    """Materialize outputs for run_id from the cache if present.
+
+    Prints a one-line cache report for the job log; returns True on a hit.
+    """
+    how = cache.fetch(key, outputs)
+    if how:
+        n, total = cache.usage()
+        print('DADA2 cache hit for %s: key %s, outputs %s; cache holds %d entries, %s'
+              % (run_id, key[:12], how, n, gb(total)))
+    return bool(how)
+
+
+def store_cached(cache, key, run_id, params, outputs):
+    """Store freshly generated outputs for run_id and print a cache report."""
+    evicted = cache.store(key, outputs, {'run_id': run_id, 'params': params})
+    n, total = cache.usage()
+    print('DADA2 cache miss for %s: key %s, stored; evicted %d entries; cache holds %d entries, %s%s'
+          % (run_id, key[:12], len(evicted), n, gb(total),
+             ' of ' + gb(cache.max_bytes) if cache.max_bytes is not None else ''))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""Condensed binary sidecars for QIIME2 distance matrices, and a reader.
+
+AUTHORS:
+    B. Ballew
+
+The *_dist.qza outputs of alpha_beta_diversity hold the full N x N
+matrix as text (data/distance-matrix.tsv).  For 10k samples that is
+100M decimal floats to parse, and consumers typically hold both the
+parsed data frame and a numpy copy.  This writes the strict upper
+triangle once as float64, in the row-major order of
+scipy.spatial.distance.squareform, to a .npy file that can be memory
+mapped, plus one sample ID per line in a separate index file.  The TSV
+is streamed a row at a time and only the upper triangle of each row is
+parsed, so memory use does not depend on the number of samples.
+
+Output (given prefix <metric>_dist):
+    <metric>_dist.condensed.npy    float64, length N * (N - 1) / 2
+    <metric>_dist.ids.txt          N sample IDs, in matrix order
+
+TO RUN:
+    python3 distance_matrix.py bray-curtis_dist.qza diversity_core_metrics/<ref>/bray-curtis_dist
+
+READ:
+    from distance_matrix import CondensedDistanceMatrix
+    dm = CondensedDistanceMatrix('diversity_core_metrics/<ref>/bray-curtis_dist')
+    df = dm.subset(['SC123', 'SC456', 'SC789'])
+
+Without this module, np.load(<prefix>.condensed.npy, mmap_mode='r') and
+scipy's squareform give the full square matrix.
+"""
+
+import argparse
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from q2_artifacts import data_member
+
+SUFFIX = '.condensed.npy'
+IDS_SUFFIX = '.ids.txt'
+
+
+def condensed_index(n, i, j):
+    """Position of (i, j), i < j, in a condensed matrix of n samples."""
+    return n * i - i * (i + 1) // 2 + j - i - 1
+
+
+def export(qza, prefix):
+    """Write the condensed sidecar and ID index for a DistanceMatrix artifact."""
+    with zipfile.ZipFile(qza) as z, z.open(data_member(z, 'distance-matrix.tsv')) as raw:
+        f = io.TextIOWrapper(raw, encoding='utf-8')
+        ids = f.readline().rstrip('\r\n').split('\t')[1:]
+        n = len(ids)
+        out = np.lib.format.open_memmap(prefix + SUFFIX, mode='w+', dtype=np.float64,
+                                        shape=(n * (n - 1) // 2,))
+        i = 0
+        for line in f:
+            if not line.strip():
+                continue
+            fields = line.rstrip('\r\n').split('\t')
+            if i >= n or fields[0] != ids[i]:
+                raise ValueError('%s: row %d is %s, expected %s' % (qza, i + 1, fields[0], ids[i] if i < n else 'none'))
+            start = condensed_index(n, i, i + 1)
+            out[start:start + n - i - 1] = np.array(fields[i + 2:], dtype=np.float64)
+            i += 1
+        if i != n:
+            raise ValueError('%s: %d rows for %d samples' % (qza, i, n))
+        out.flush()
+        del out
+    with open(prefix + IDS_SUFFIX, 'w') as f:
+        f.writelines(s + '\n' for s in ids)
+    return n
+
+
+class CondensedDistanceMatrix(object):
+    """Read-only, memory-mapped access to a condensed distance matrix sidecar.
+
+    Only the entries needed for a lookup are read from disk; slicing a
+    subset of k samples touches k * (k - 1) / 2 values.
+    """
+
+    def __init__(self, prefix):
+        if prefix.endswith(SUFFIX):
+            prefix = prefix[:-len(SUFFIX)]
+        self.condensed = np.load(prefix + SUFFIX, mmap_mode='r')
+        with open(prefix + IDS_SUFFIX) as f:
+            self.ids = np.array([line.rstrip('\n') for line in f], dtype=object)
+        self._pos = pd.Series(np.arange(len(self.ids)), index=self.ids)
+        if len(self.condensed) != len(self.ids) * (len(self.ids) - 1) // 2:
+            raise ValueError('%s: %d distances for %d samples' % (prefix, len(self.condensed), len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, ids):
+        return self._pos[list(ids)].values
+
+    def distance(self, a, b):
+        """Distance between two samples."""
+        i, j = sorted(self.positions([a, b]))
+        return 0.0 if i == j else float(self.condensed[condensed_index(len(self), i, j)])
+
+    def subset_condensed(self, ids):
+        """Condensed distances among the given samples, in the order given."""
+        p = self.positions(ids)
+        r, c = np.triu_indices(len(p), 1)
+        i, j = np.minimum(p[r], p[c]), np.maximum(p[r], p[c])
+        out = np.zeros(len(r))
+        off = i != j
+        out[off] = self.condensed[condensed_index(len(self), i[off], j[off])]
+        return out
+
+    def subset(self, ids):
+        """Square data frame of distances among the given samples."""
+        ids = list(ids)
+        k = len(ids)
+        m = np.zeros((k, k))
+        r, c = np.triu_indices(k, 1)
+        m[r, c] = m[c, r] = self.subset_condensed(ids)
+        return pd.DataFrame(m, index=ids, columns=ids)
+
+    def row(self, sample):
+        """Distances from one sample to every sample."""
+        n = len(self)
+        i = int(self._pos[sample])
+        others = np.arange(n)
+        lo, hi = np.minimum(others, i), np.maximum(others, i)
+        d = np.zeros(n)
+        off = others != i
+        d[off] = self.condensed[condensed_index(n, lo[off], hi[off])]
+        return pd.Series(d, index=self.ids)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Write a QIIME2 distance matrix as a condensed, memory-mappable array.')
+    p.add_argument('qza', help='DistanceMatrix artifact')
+    p.add_argument('prefix', help='output prefix; writes <prefix>%s and <prefix>%s' % (SUFFIX, IDS_SUFFIX))
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(os.path.dirname(os.path.abspath(args.prefix)), exist_ok=True)
+    export(args.qza, args.prefix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""Read QIIME2 artifacts (.qza/.qzv) without the qiime CLI.
+
+AUTHORS:
+    B. Ballew
+
+Artifacts are zip archives laid out as <uuid>/metadata.yaml and
+<uuid>/data/<files>.  Starting the qiime CLI costs several seconds
+per call and `qiime tools export` writes every member to disk, so
+pipeline scripts that only need to read a table or taxonomy pull the
+data member straight out of the archive instead.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+import pandas as pd
+
+
+def data_member(z, name):
+    """Return the archive path of data/<name> in an open ZipFile."""
+    for n in z.namelist():
+        parts = n.split('/')
+        if len(parts) == 3 and parts[1] == 'data' and parts[2] == name:
+            return n
+    raise KeyError('data/' + name + ' not found in ' + z.filename)
+
+
+def load_biom(qza):
+    """Load the BIOM table from a FeatureTable[Frequency] artifact."""
+    import biom
+    with zipfile.ZipFile(qza) as z:
+        tmp = tempfile.mkdtemp()
+        try:
+            with z.open(data_member(z, 'feature-table.biom')) as src, \
+                    open(os.path.join(tmp, 'feature-table.biom'), 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            return biom.load_table(os.path.join(tmp, 'feature-table.biom'))
+        finally:
+            shutil.rmtree(tmp)
+
+
+def load_taxonomy(qza):
+    """Load a FeatureData[Taxonomy] artifact as a data frame indexed by feature ID.
+
+    Whitespace is stripped from the start and end of each Taxon (SILVA
+    occasionally has trailing spaces that break downstream steps).
+    """
+    with zipfile.ZipFile(qza) as z:
+        with z.open(data_member(z, 'taxonomy.tsv')) as f:
+            df = pd.read_csv(io.TextIOWrapper(f, encoding='utf-8'), sep='\t', dtype=str,
+                             na_filter=False, comment=None)
+    df = df.set_index(df.columns[0])
+    df['Taxon'] = df['Taxon'].str.strip()
+    return df
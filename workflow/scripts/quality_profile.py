@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+"""Per-run read quality profiles and DADA2 trim/truncation suggestions.
+
+AUTHORS:
+    B. Ballew
+
+`qiime demux summarize` plots quality from a subsample of a few
+thousand reads, and dada2_denoise trim/truncation lengths are then
+chosen by eye.  This script instead streams every fastq listed in a
+run ID's QIIME2 manifest, samples in parallel, and counts reads by
+(position, quality score) in one fixed-size array per direction, so
+memory use does not depend on the number of reads.  From those
+histograms, per direction:
+
+    - usable length: the last position reached by at least
+      min_read_fraction of reads (DADA2 discards reads shorter than
+      the truncation length)
+    - trim_left: leading positions whose `quantile` quality is below
+      min_quality
+    - truncate_length: the first position after trim_left where the
+      `quantile` quality falls below min_quality, or the usable length
+
+If the two truncated reads would not overlap by min_overlap over an
+amplicon of amplicon_length, the truncation points are moved out one
+base at a time, taking the better-quality side each time, until they
+do or both reach their usable length (reported as a warning).
+
+Writes, to the output directory:
+    histograms.npz     raw counts, shape (MAX_LENGTH, NUM_SCORES) per direction
+    profile.tsv        per-position reads, mean and quantile qualities
+    dada2_params.yaml  trim_left_* and truncate_length_* for dada2_denoise
+
+TO RUN:
+    python3 quality_profile.py <runID>_Q2_manifest.txt out/quality_profiles/<runID>/ --threads 8
+"""
+
+import argparse
+import csv
+import gzip
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+MAX_LENGTH = 1000  # positions beyond this are counted at the last position
+NUM_SCORES = 94  # printable ASCII quality characters
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+DEFAULT_CRITERIA = {
+    'min_quality': 25,
+    'quantile': 0.25,
+    'amplicon_length': 292,
+    'min_overlap': 12,
+    'min_read_fraction': 0.99,
+}
+
+
+def quality_lines(path, block_size=1 << 24):
+    """Yield lists of quality lines from a gzipped fastq, a block at a time."""
+    with gzip.open(path, 'rb') as f:
+        rest, n = b'', 0
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines = (rest + block).split(b'\n')
+            rest = lines.pop()
+            yield lines[(3 - n) % 4::4]
+            n += len(lines)
+        if rest and n % 4 == 3:
+            yield [rest]
+
+
+def histogram(path, offset=33):
+    """Counts of reads by (position, quality score) for one fastq."""
+    hist = np.zeros(MAX_LENGTH * NUM_SCORES, dtype=np.int64)
+    for quals in quality_lines(path):
+        quals = [q.rstrip(b'\r') for q in quals]
+        lengths = np.fromiter(map(len, quals), dtype=np.int64, count=len(quals))
+        if not lengths.sum():
+            continue
+        scores = np.frombuffer(b''.join(quals), dtype=np.uint8).astype(np.int64) - offset
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pos = np.minimum(np.arange(len(scores)) - starts, MAX_LENGTH - 1)
+        hist += np.bincount(pos * NUM_SCORES + np.clip(scores, 0, NUM_SCORES - 1),
+                            minlength=MAX_LENGTH * NUM_SCORES)
+    return hist.reshape(MAX_LENGTH, NUM_SCORES)
+
+
+def _histogram(args):
+    return args[0], histogram(*args[1:])
+
+
+def profile_run(fastqs, offset=33, threads=1):
+    """Sum per-direction histograms of [(direction, path), ...] in parallel."""
+    hists = {'forward': np.zeros((MAX_LENGTH, NUM_SCORES), dtype=np.int64),
+             'reverse': np.zeros((MAX_LENGTH, NUM_SCORES), dtype=np.int64)}
+    with Pool(max(1, threads)) as pool:
+        for direction, h in pool.imap_unordered(_histogram, [(d, p, offset) for d, p in fastqs]):
+            hists[direction] += h
+    return hists
+
+
+def quantile_scores(hist, q):
+    """Quality score at quantile q of the reads covering each position (-1 where none do)."""
+    cum = hist.cumsum(axis=1)
+    total = cum[:, -1]
+    out = (cum < np.maximum(q * total, 1)[:, None]).sum(axis=1)
+    return np.where(total > 0, out, -1)
+
+
+def summarize(hist):
+    """Per-position table of read counts, mean and quantile qualities."""
+    reads = hist.sum(axis=1)
+    n = int(np.flatnonzero(reads)[-1]) + 1 if reads.any() else 0
+    scores = np.arange(NUM_SCORES)
+    df = pd.DataFrame({'position': np.arange(1, n + 1), 'reads': reads[:n],
+                       'mean': (hist[:n] @ scores) / np.maximum(reads[:n], 1)})
+    for q in QUANTILES:
+        df['q%d' % round(q * 100)] = quantile_scores(hist[:n], q)
+    return df
+
+
+def usable_length(hist, min_read_fraction):
+    reads = hist.sum(axis=1)
+    if not reads[0]:
+        return 0
+    return int((reads >= min_read_fraction * reads[0]).sum())
+
+
+def trim_and_truncate(hist, criteria):
+    """(trim_left, truncate_length, usable length, per-position quality) for one direction."""
+    length = usable_length(hist, criteria['min_read_fraction'])
+    qual = quantile_scores(hist[:length], criteria['quantile'])
+    good = np.flatnonzero(qual >= criteria['min_quality'])
+    if not len(good):  # uniformly poor; leave the reads alone
+        return 0, length, length, qual
+    trim = int(good[0])
+    bad = np.flatnonzero(qual[trim:] < criteria['min_quality'])
+    trunc = trim + int(bad[0]) if len(bad) else length
+    return trim, trunc, length, qual
+
+
+def suggest(forward, reverse, criteria=None):
+    """dada2_denoise parameters from forward and reverse histograms.
+
+    Returns (params dict, list of notes).
+    """
+    c = dict(DEFAULT_CRITERIA, **(criteria or {}))
+    trim_f, trunc_f, len_f, qual_f = trim_and_truncate(forward, c)
+    trim_r, trunc_r, len_r, qual_r = trim_and_truncate(reverse, c)
+    notes = ['quality: first position with %d%% of reads below Q%d' % (c['quantile'] * 100, c['min_quality'])]
+    need = c['amplicon_length'] + c['min_overlap']
+    while trunc_f + trunc_r < need and (trunc_f < len_f or trunc_r < len_r):
+        next_f = qual_f[trunc_f] if trunc_f < len_f else -1
+        next_r = qual_r[trunc_r] if trunc_r < len_r else -1
+        if next_f >= next_r:
+            trunc_f += 1
+        else:
+            trunc_r += 1
+    overlap = trunc_f + trunc_r - c['amplicon_length']
+    if overlap < c['min_overlap']:
+        notes.append('WARNING: reads overlap by only %d bases over a %d base amplicon even untruncated; '
+                     'DADA2 will fail to merge most pairs' % (overlap, c['amplicon_length']))
+    else:
+        notes.append('overlap: %d bases over a %d base amplicon' % (overlap, c['amplicon_length']))
+    params = {'trim_left_forward': trim_f, 'trim_left_reverse': trim_r,
+              'truncate_length_forward': trunc_f, 'truncate_length_reverse': trunc_r}
+    return params, notes
+
+
+def write_params(path, run_id, params, notes, reads):
+    with open(path, 'w') as f:
+        f.write('# dada2_denoise parameters derived from read quality of run %s\n' % run_id)
+        f.write('# reads profiled: %d forward, %d reverse\n' % (reads['forward'], reads['reverse']))
+        for n in notes:
+            f.write('# %s\n' % n)
+        for k, v in params.items():
+            f.write('%s: %d\n' % (k, v))
+
+
+def read_params(path):
+    """The trim/truncation lengths from a dada2_params.yaml written above."""
+    params = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                k, v = line.split(':', 1)
+                params[k.strip()] = int(v)
+    return params
+
+
+def read_manifest(path):
+    """[(direction, absolute-filepath), ...] from a per-run QIIME2 manifest."""
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    return [(r[2], r[1]) for r in rows[1:] if r]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Profile read quality of one run ID and suggest DADA2 parameters.')
+    p.add_argument('manifest', help='per-run QIIME2 manifest (sample-id,absolute-filepath,direction)')
+    p.add_argument('out_dir')
+    p.add_argument('--run-id', help='run ID, for the output header (default: from the manifest name)')
+    p.add_argument('--threads', type=int, default=1)
+    p.add_argument('--phred-offset', type=int, default=33)
+    for k, v in DEFAULT_CRITERIA.items():
+        p.add_argument('--' + k.replace('_', '-'), type=type(v), default=v)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    run_id = args.run_id or os.path.basename(args.manifest).replace('_Q2_manifest.txt', '')
+    hists = profile_run(read_manifest(args.manifest), args.phred_offset, args.threads)
+    os.makedirs(args.out_dir, exist_ok=True)
+    np.savez_compressed(os.path.join(args.out_dir, 'histograms.npz'), phred_offset=args.phred_offset, **hists)
+    pd.concat([summarize(h).assign(direction=d) for d, h in hists.items()]).round(2).to_csv(
+        os.path.join(args.out_dir, 'profile.tsv'), sep='\t', index=False)
+    params, notes = suggest(hists['forward'], hists['reverse'], {k: getattr(args, k) for k in DEFAULT_CRITERIA})
+    write_params(os.path.join(args.out_dir, 'dada2_params.yaml'), run_id, params, notes,
+                 {d: int(h[0].sum()) for d, h in hists.items()})
+    print('%s: %s' % (run_id, ', '.join('%s=%d' % kv for kv in params.items())))
+    for n in notes:
+        print('%s: %s' % (run_id, n), file=sys.stderr if n.startswith('WARNING') else sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+"""Predict threads, memory and walltime per job from past benchmarks.
+
+AUTHORS:
+    B. Ballew
+
+Every job writes a snakemake benchmark file under run_times/<rule>/,
+but those record only what a job used, not how big its inputs were.
+This module keeps a history table joining the two:
+
+    rule  benchmark  mtime  input_bytes  threads  s  max_rss  cpu_time
+
+and fits, per rule, log-log least-squares regressions of CPU time and
+peak RSS on input size.  For each new job:
+    - threads = predicted CPU seconds / target_runtime_min, rounded up
+    - runtime = predicted CPU seconds / (threads * the rule's observed
+      parallel efficiency), in minutes
+    - mem_mb  = predicted peak RSS
+Memory and walltime are inflated by the larger of `safety` and the
+95th percentile of the regression residuals, multiplied by the
+snakemake attempt number (so --restart-times retries get more), and
+everything is clamped to the configured limits.  Rules with fewer than
+min_history records get the defaults instead.
+
+Input sizes used for each prediction are kept in memory; harvest()
+(called from onsuccess/onerror in the Snakefile) matches them to the
+benchmark files written during the run and appends them to the
+history, so predictions improve as more runs complete.  Point
+resource_history at a shared path to pool records across projects.
+Jobs served from a cache (DADA2 or taxonomy cache hits) do not do the
+work their input size implies; their run blocks call mark_cached() so
+that harvest() leaves them out of the history.
+"""
+
+import fcntl
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+CACHED_SUFFIX = '.cached'
+HISTORY_COLUMNS = ['rule', 'benchmark', 'mtime', 'input_bytes', 'threads', 's', 'max_rss', 'cpu_time']
+
+DEFAULT_LIMITS = {
+    'min_threads': 1,
+    'max_threads': 8,
+    'min_mem_mb': 1000,
+    'max_mem_mb': 64000,
+    'default_mem_mb': 8000,
+    'min_runtime_min': 10,
+    'max_runtime_min': 1440,
+    'default_runtime_min': 1440,
+    'target_runtime_min': 60,
+    'min_history': 3,
+    'safety': 1.25,
+}
+
+
+def clamp(x, lo, hi):
+    return int(max(lo, min(hi, x)))
+
+
+def fit_loglog(x, y):
+    """Least-squares fit of log(y) = a + b*log(x).
+
+    Returns (a, b, 95th percentile residual factor).
+    """
+    lx, ly = np.log(np.maximum(x, 1)), np.log(np.maximum(y, 1e-3))
+    if np.ptp(lx) == 0:
+        a, b = ly.mean(), 0.0
+    else:
+        b, a = np.polyfit(lx, ly, 1)
+    resid = ly - (a + b * lx)
+    return a, b, math.exp(np.percentile(resid, 95)) if len(resid) else 1.0
+
+
+class RuleModel(object):
+    """Callables for one rule's threads: and resources: directives."""
+
+    def __init__(self, model, rule, default_threads, size):
+        self.model = model
+        self.rule = rule
+        self.default_threads = default_threads
+        self.size = size
+
+    def _input_bytes(self, wildcards, input):
+        if self.size is not None:
+            return self.size(wildcards)
+        return sum(os.path.getsize(f) for f in input if os.path.exists(f))
+
+    def threads(self, wildcards, input):
+        return self.model.predict_threads(self.rule, self._input_bytes(wildcards, input), self.default_threads)
+
+    def mem_mb(self, wildcards, input, attempt):
+        return self.model.predict_mem_mb(self.rule, self._input_bytes(wildcards, input), attempt)
+
+    def runtime(self, wildcards, input, threads, attempt):
+        # threads here is after snakemake's --cores constraint, so this
+        # is where the job's actual size is recorded for harvest()
+        n = self._input_bytes(wildcards, input)
+        self.model.pending[self.model.benchmark(self.rule, wildcards)] = (self.rule, n, threads)
+        return self.model.predict_runtime(self.rule, n, threads, attempt)
+
+    def mark_cached(self, wildcards, cached=True):
+        self.model.mark_cached(self.rule, wildcards, cached)
+
+
+class ResourceModel(object):
+    """Resource predictions for the rules of one pipeline run."""
+
+    def __init__(self, run_times_dir, history_path, limits=None):
+        self.run_times_dir = run_times_dir
+        self.history_path = history_path
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.pending = {}
+        self.started = time.time()
+        self.history = self._load()
+        self._fits = {}
+
+    def _load(self):
+        if not os.path.exists(self.history_path):
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        df = pd.read_csv(self.history_path, sep='\t')
+        return df.drop_duplicates(['benchmark', 'mtime'], keep='last')
+
+    def rule(self, name, default_threads=1, size=None):
+        """Return a RuleModel; size(wildcards) overrides the input byte count."""
+        return RuleModel(self, name, default_threads, size)
+
+    def benchmark(self, rule, wildcards):
+        """Benchmark path, following the run_times/<rule>/<wildcards>.tsv convention."""
+        return os.path.join(self.run_times_dir, rule, '_'.join(str(v) for v in wildcards) + '.tsv')
+
+    def mark_cached(self, rule, wildcards, cached=True):
+        """Flag the job's benchmark as served from a cache, so harvest() skips it, or clear the flag."""
+        marker = self.benchmark(rule, wildcards) + CACHED_SUFFIX
+        if cached:
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            open(marker, 'w').close()
+        elif os.path.exists(marker):
+            os.remove(marker)
+
+    def fit(self, rule):
+        if rule not in self._fits:
+            h = self.history[self.history['rule'] == rule]
+            if len(h) < self.limits['min_history']:
+                self._fits[rule] = None
+            else:
+                efficiency = (h['cpu_time'] / (h['s'] * h['threads']).clip(lower=1e-3)).median()
+                self._fits[rule] = {'cpu': fit_loglog(h['input_bytes'].values, h['cpu_time'].values),
+                                    'rss': fit_loglog(h['input_bytes'].values, h['max_rss'].values),
+                                    'efficiency': min(1.0, max(0.1, efficiency))}
+        return self._fits[rule]
+
+    def _predict(self, f, n, upper=False):
+        a, b, resid = f
+        y = math.exp(a + b * math.log(max(n, 1)))
+        return y * max(self.limits['safety'], resid) if upper else y
+
+    def predict_threads(self, rule, n, default):
+        L = self.limits
+        f = self.fit(rule)
+        if f is None:
+            return clamp(default, L['min_threads'], L['max_threads'])
+        cpu = self._predict(f['cpu'], n) / f['efficiency']
+        return clamp(math.ceil(cpu / (L['target_runtime_min'] * 60)), L['min_threads'], L['max_threads'])
+
+    def predict_mem_mb(self, rule, n, attempt=1):
+        L = self.limits
+        f = self.fit(rule)
+        mem = L['default_mem_mb'] if f is None else self._predict(f['rss'], n, upper=True)
+        return clamp(math.ceil(mem * attempt), L['min_mem_mb'], L['max_mem_mb'])
+
+    def predict_runtime(self, rule, n, threads, attempt=1):
+        L = self.limits
+        f = self.fit(rule)
+        if f is None:
+            minutes = L['default_runtime_min']
+        else:
+            minutes = self._predict(f['cpu'], n, upper=True) / (threads * f['efficiency']) / 60
+        return clamp(math.ceil(minutes * attempt), L['min_runtime_min'], L['max_runtime_min'])
+
+    def harvest(self):
+        """Append benchmarks written during this run to the history file.
+
+        Returns the number of records added.
+        """
+        rows = []
+        for path, (rule, n, t) in self.pending.items():
+            if not os.path.exists(path) or os.path.getmtime(path) < self.started:
+                continue
+            if os.path.exists(path + CACHED_SUFFIX):
+                continue
+            b = pd.read_csv(path, sep='\t').iloc[-1]
+            used = pd.to_numeric(b[['s', 'max_rss', 'cpu_time']], errors='coerce')
+            if used.isna().any():  # very short jobs report '-' for memory
+                continue
+            rows.append([rule, path, os.path.getmtime(path), n, t] + list(used))
+        if not rows:
+            return 0
+        new = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+        os.makedirs(os.path.dirname(self.history_path) or '.', exist_ok=True)
+        # concurrent runs (watch branches, batch projects) share the history
+        with open(self.history_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            new.to_csv(self.history_path, sep='\t', index=False, mode='a',
+                       header=not os.path.exists(self.history_path))
+        self.pending = {}
+        return len(rows)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""Chunked sparse export of BIOM feature tables, and a reader for slicing.
+
+AUTHORS:
+    B. Ballew
+
+`biom convert --to-tsv` writes every cell of the feature x sample table,
+which for large projects is several GB of mostly zeros that every
+consumer then has to parse in full.  This exports the same table as
+compressed sparse arrays in HDF5, streaming the BIOM file in blocks of
+rows so that memory use is bounded by --chunk-rows, not table size.
+
+Output layout (feature-table.sparse.h5):
+    /features, /samples     IDs, in BIOM order
+    /csr/data, /csr/indices, /csr/indptr
+                            feature-major (rows = features,
+                            indices = sample positions)
+    /csc/data, /csc/indices, /csc/indptr
+                            sample-major (columns = samples,
+                            indices = feature positions)
+Both orientations are stored so that slicing a handful of features or
+samples only reads those rows/columns.
+
+TO RUN:
+    python3 sparse_feature_table.py feature-table.biom feature-table.sparse.h5
+
+READ:
+    from sparse_feature_table import SparseFeatureTable
+    with SparseFeatureTable('feature-table.sparse.h5') as t:
+        df = t.sample_slice(['SC123', 'SC456'])
+"""
+
+import argparse
+
+import h5py
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+STR_DTYPE = h5py.special_dtype(vlen=str)
+
+
+def _ids(ds):
+    return np.array([i.decode('utf-8') if isinstance(i, bytes) else i for i in ds[()]], dtype=object)
+
+
+def _copy_compressed(src, dst, name, chunk_rows):
+    """Stream one BIOM compressed matrix (data/indices/indptr) into dst/name."""
+    indptr = src['indptr'][()]
+    g = dst.create_group(name)
+    g.create_dataset('indptr', data=indptr, compression='gzip')
+    nnz = int(indptr[-1])
+    chunks = (min(max(nnz, 1), 1 << 16),)
+    data = g.create_dataset('data', shape=(nnz,), dtype=src['data'].dtype, chunks=chunks, compression='gzip')
+    indices = g.create_dataset('indices', shape=(nnz,), dtype='int32', chunks=chunks, compression='gzip')
+    for r0 in range(0, len(indptr) - 1, chunk_rows):
+        a = int(indptr[r0])
+        b = int(indptr[min(r0 + chunk_rows, len(indptr) - 1)])
+        if b > a:
+            data[a:b] = src['data'][a:b]
+            indices[a:b] = src['indices'][a:b]
+
+
+def export(biom_path, out_path, chunk_rows=10000):
+    """Write a BIOM 2.x (HDF5) table to the sparse layout described above."""
+    with h5py.File(biom_path, 'r') as src, h5py.File(out_path, 'w') as dst:
+        features = _ids(src['observation/ids'])
+        samples = _ids(src['sample/ids'])
+        dst.create_dataset('features', data=features.astype(object), dtype=STR_DTYPE)
+        dst.create_dataset('samples', data=samples.astype(object), dtype=STR_DTYPE)
+        dst.attrs['shape'] = (len(features), len(samples))
+        _copy_compressed(src['observation/matrix'], dst, 'csr', chunk_rows)
+        _copy_compressed(src['sample/matrix'], dst, 'csc', chunk_rows)
+
+
+class SparseFeatureTable(object):
+    """Read-only access to a feature-table.sparse.h5 file.
+
+    Slices read only the requested rows (features) or columns (samples)
+    and are returned as dense data frames of features x samples.
+    """
+
+    def __init__(self, path):
+        self.h5 = h5py.File(path, 'r')
+        self.features = _ids(self.h5['features'])
+        self.samples = _ids(self.h5['samples'])
+        self.shape = tuple(int(i) for i in self.h5.attrs['shape'])
+        self._feature_pos = None
+        self._sample_pos = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.h5.close()
+
+    def _read(self, group, positions, n_other):
+        """Read selected rows of a compressed matrix as a CSR matrix."""
+        g = self.h5[group]
+        indptr = g['indptr'][()]
+        data, indices, ptr = [], [], [0]
+        for p in positions:
+            a, b = int(indptr[p]), int(indptr[p + 1])
+            data.append(g['data'][a:b])
+            indices.append(g['indices'][a:b])
+            ptr.append(ptr[-1] + b - a)
+        if not positions:
+            return sparse.csr_matrix((0, n_other))
+        return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), ptr),
+                                 shape=(len(positions), n_other))
+
+    def feature_slice(self, ids):
+        """Counts for the given feature IDs across all samples."""
+        if self._feature_pos is None:
+            self._feature_pos = pd.Series(np.arange(len(self.features)), index=self.features)
+        m = self._read('csr', list(self._feature_pos[list(ids)]), len(self.samples))
+        return pd.DataFrame(m.toarray(), index=list(ids), columns=self.samples)
+
+    def sample_slice(self, ids):
+        """Counts for the given sample IDs across all features."""
+        if self._sample_pos is None:
+            self._sample_pos = pd.Series(np.arange(len(self.samples)), index=self.samples)
+        m = self._read('csc', list(self._sample_pos[list(ids)]), len(self.features))
+        return pd.DataFrame(m.toarray().T, index=self.features, columns=list(ids))
+
+    def sample_totals(self):
+        """Total count per sample."""
+        g = self.h5['csc']
+        indptr = g['indptr'][()]
+        cumulative = np.concatenate([[0], np.cumsum(g['data'][()])])
+        return pd.Series(cumulative[indptr[1:]] - cumulative[indptr[:-1]], index=self.samples)
+
+    def to_scipy(self):
+        """The full table as a features x samples CSR matrix."""
+        g = self.h5['csr']
+        return sparse.csr_matrix((g['data'][()], g['indices'][()], g['indptr'][()]), shape=self.shape)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Export a BIOM table to chunked sparse HDF5.')
+    p.add_argument('biom', help='BIOM 2.x (HDF5) feature table')
+    p.add_argument('out', help='output .h5')
+    p.add_argument('--chunk-rows', type=int, default=10000,
+                   help='rows (features, or samples for the CSC copy) per block (default: %(default)s)')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    export(args.biom, args.out, args.chunk_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+"""Run a rule's command against node-local copies of its inputs and outputs.
+
+AUTHORS:
+    B. Ballew
+
+With many jobs reading and writing multi-GB .qza/.qzv archives on the
+shared out_dir at once, NFS throughput collapses.  When scratch_dir is
+set in the config, QIIME rules run through this wrapper instead:
+
+    1. Each input is fetched into <scratch>/inputs/ once per node and
+       reused by later jobs on that node while its size and mtime are
+       unchanged (classifiers and merged tables are read by many jobs).
+    2. Inputs are hardlinked into a per-job mirror of out_dir, every
+       out_dir path in the command is pointed at the mirror, and the
+       command is run there.
+    3. On success, declared outputs are copied next to their final
+       location and renamed into place, so a partly written output is
+       never visible in out_dir.  Nothing is copied back on failure.
+
+A record of bytes fetched, reused and returned, and of time spent
+staging, is written next to the rule's benchmark files as
+run_times/<rule>/<wildcards>.staging.tsv.  baseline_s is the walltime
+of the last unstaged run of the same job, when one exists, and
+time_saved_s compares it with this run.
+
+The command is read from stdin; see staged() in the Snakefile.
+
+TO RUN:
+    python3 stage.py --scratch /scratch/$USER/q2 --out-dir /path/to/out/ \
+        --record-dir /path/to/out/run_times/rule --input ... --output ... <<'EOF'
+    qiime ...
+    EOF
+"""
+
+import argparse
+import contextlib
+import fcntl
+import glob
+import hashlib
+import itertools
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+RECORD_COLUMNS = ['bytes_fetched', 'bytes_reused', 'bytes_returned', 'stage_in_s', 'run_s',
+                  'stage_out_s', 'baseline_s', 'time_saved_s']
+
+
+def _hash(s):
+    return hashlib.sha1(s.encode()).hexdigest()[:16]
+
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fetch(cache_dir, path, dest):
+    """Hardlink a node-local copy of path to dest; return (local copy, bytes copied).
+
+    Copies are named by path and (size, mtime), so a changed input is
+    fetched again and the stale copy removed.  The link is made under the
+    entry's lock, so evict() cannot remove the copy before this job holds
+    its own link to it.
+    """
+    st = os.stat(path)
+    prefix = _hash(os.path.abspath(path))
+    local = os.path.join(cache_dir, '%s.%s_%s' % (prefix, _hash('%d:%d' % (st.st_size, st.st_mtime_ns)),
+                                                  os.path.basename(path)))
+    copied = 0
+    with _locked(os.path.join(cache_dir, prefix + '.lock')):
+        if os.path.exists(local):
+            os.utime(local)  # for eviction order
+        else:
+            for stale in glob.glob(os.path.join(cache_dir, prefix + '.*_*')):
+                os.remove(stale)  # jobs still using it hold a hardlink
+            tmp = local + '.part'
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, local)
+            copied = st.st_size
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.link(local, dest)
+    return local, copied
+
+
+def evict(cache_dir, max_bytes, keep):
+    """Remove least recently used node-local inputs above max_bytes.
+
+    Each entry is removed under the lock fetch() takes; entries whose
+    lock is held by another job are in use and skipped.
+    """
+    files = [f for f in glob.glob(os.path.join(cache_dir, '*_*')) if not f.endswith('.part')]
+    files.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in files)
+    for f in files:
+        if total <= max_bytes:
+            break
+        if f in keep:
+            continue
+        prefix = os.path.basename(f).split('.', 1)[0]
+        with open(os.path.join(cache_dir, prefix + '.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                if os.path.exists(f):
+                    total -= os.path.getsize(f)
+                    os.remove(f)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def mirror_path(job_dir, out_dir, path):
+    """Location of path inside the job's mirror of out_dir."""
+    path = os.path.abspath(path)
+    if path.startswith(out_dir):
+        return os.path.join(job_dir, 'out', path[len(out_dir):])
+    return os.path.join(job_dir, 'ext', _hash(path), os.path.basename(path))
+
+
+def rewrite(cmd, job_dir, out_dir, inputs):
+    """Point every out_dir path and every staged outside input at the job mirror."""
+    outside = sorted((p for p in inputs if not os.path.abspath(p).startswith(out_dir)), key=len, reverse=True)
+    for p in outside:
+        cmd = cmd.replace(p, mirror_path(job_dir, out_dir, p))
+    return cmd.replace(out_dir, os.path.join(job_dir, 'out') + '/')
+
+
+def find_benchmark(record_dir, name):
+    """The rule's benchmark file for this job, if it can be identified."""
+    candidates = [f for f in glob.glob(os.path.join(record_dir, '*.tsv')) if not f.endswith('.staging.tsv')]
+    exact = os.path.join(record_dir, name + '.tsv')
+    if exact in candidates:
+        return exact
+    suffixed = [f for f in candidates if f.endswith('_' + name + '.tsv')]
+    if len(suffixed) == 1:
+        return suffixed[0]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def record_name(record_dir, tokens):
+    """Name of the job's records: its wildcard values joined by '_', as in its benchmark file.
+
+    {wildcards} may come as bare values, in the order of the rule's
+    patterns, or as name=value pairs sorted by name.  For the latter,
+    the order of an existing benchmark or staging record is used.
+    """
+    pairs = [kv.partition('=') for t in tokens for kv in (t.split(',') if '=' in t else [t])]
+    values = [value if sep else name for name, sep, value in pairs]
+    if any(sep for _, sep, _ in pairs) and len(values) > 1:
+        existing = set(re.sub(r'(\.staging)?\.tsv$', '', os.path.basename(f))
+                       for f in glob.glob(os.path.join(record_dir, '*.tsv')))
+        for order in itertools.permutations(values):
+            if '_'.join(order) in existing:
+                return '_'.join(order)
+    return '_'.join(values) or os.path.basename(record_dir.rstrip('/'))
+
+
+def baseline(record_dir, name):
+    """Walltime of the last unstaged run of this job, or None."""
+    record = os.path.join(record_dir, name + '.staging.tsv')
+    if os.path.exists(record):
+        b = pd.read_csv(record, sep='\t')['baseline_s'].iloc[-1]
+        return None if pd.isna(b) else float(b)
+    bench = find_benchmark(record_dir, name)
+    if bench is None:
+        return None
+    return float(pd.read_csv(bench, sep='\t')['s'].iloc[-1])
+
+
+def stage(cmd, scratch, out_dir, inputs, outputs, max_bytes=None):
+    """Run cmd in node-local scratch; returns (exit code, record dict)."""
+    cache_dir = os.path.join(scratch, 'inputs')
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(os.path.join(scratch, 'jobs'), exist_ok=True)
+    job_dir = tempfile.mkdtemp(dir=os.path.join(scratch, 'jobs'))
+    rec = dict.fromkeys(RECORD_COLUMNS, 0)
+    try:
+        t0 = time.time()
+        local_inputs = set()
+        for p in dict.fromkeys(inputs):
+            if not os.path.isfile(p):
+                continue
+            m = mirror_path(job_dir, out_dir, p)
+            local, copied = fetch(cache_dir, p, m)
+            local_inputs.add(local)
+            rec['bytes_fetched'] += copied
+            rec['bytes_reused'] += os.path.getsize(m) if not copied else 0
+        for p in outputs:
+            os.makedirs(os.path.dirname(mirror_path(job_dir, out_dir, p)), exist_ok=True)
+        if max_bytes is not None:
+            evict(cache_dir, max_bytes, local_inputs)
+        t1 = time.time()
+        code = subprocess.call(['bash', '-c', 'set -euo pipefail; ' + rewrite(cmd, job_dir, out_dir, inputs)],
+                               cwd=job_dir)
+        t2 = time.time()
+        if code == 0:
+            for p in outputs:
+                m = mirror_path(job_dir, out_dir, p)
+                if not os.path.exists(m):
+                    continue  # snakemake reports the missing output
+                tmp = p + '.staging'
+                os.makedirs(os.path.dirname(p), exist_ok=True)
+                shutil.copyfile(m, tmp)
+                os.replace(tmp, p)
+                rec['bytes_returned'] += os.path.getsize(p)
+        t3 = time.time()
+        rec.update(stage_in_s=t1 - t0, run_s=t2 - t1, stage_out_s=t3 - t2)
+        return code, rec
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def write_record(record_dir, name, rec):
+    base = baseline(record_dir, name)
+    total = rec['stage_in_s'] + rec['run_s'] + rec['stage_out_s']
+    rec = dict(rec, baseline_s=base, time_saved_s=None if base is None else base - total)
+    os.makedirs(record_dir, exist_ok=True)
+    pd.DataFrame([rec], columns=RECORD_COLUMNS).round(2).to_csv(
+        os.path.join(record_dir, name + '.staging.tsv'), sep='\t', index=False)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Run a command (read from stdin) in node-local scratch.')
+    p.add_argument('--scratch', required=True, help='node-local directory; environment variables are expanded')
+    p.add_argument('--out-dir', required=True, help='pipeline out_dir; paths under it are mirrored in scratch')
+    p.add_argument('--record-dir', required=True, help='run_times/<rule> directory for the staging record')
+    p.add_argument('--wildcards', nargs='*', default=[], help='{wildcards}, used to name the record')
+    p.add_argument('--input', nargs='*', default=[])
+    p.add_argument('--output', nargs='*', default=[])
+    p.add_argument('--max-gb', type=float, help='cap on node-local copies of inputs')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    scratch = os.path.expandvars(args.scratch)
+    out_dir = os.path.abspath(args.out_dir) + '/'
+    max_bytes = args.max_gb * 1e9 if args.max_gb else None
+    code, rec = stage(sys.stdin.read(), scratch, out_dir, args.input, args.output, max_bytes)
+    if code == 0:
+        write_record(args.record_dir, record_name(args.record_dir, args.wildcards), rec)
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
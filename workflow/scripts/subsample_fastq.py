@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+"""Deterministic subsampling of paired fastqs for pilot runs.
+
+AUTHORS:
+    B. Ballew
+
+Pilot runs put a small, reproducible subset of each sample's read pairs
+through the full pipeline.  Each R1/R2 pair is streamed once, in
+lockstep, and read pairs are kept either:
+    - by count: a uniform sample of --reads pairs (reservoir sampling,
+      Li's algorithm L, so random numbers are only drawn when a pair
+      enters the reservoir), or
+    - by fraction: each pair independently with probability --fraction.
+Mates are always kept or dropped together, and kept pairs are written
+in their original order.  The random stream is seeded from --seed and
+the sample ID, so the same config gives the same subset on every run
+while samples are sampled independently of each other.
+
+A one-line TSV record of the sampling parameters and counts is written
+with --record.
+
+TO RUN:
+    python3 subsample_fastq.py in_R1.fastq.gz in_R2.fastq.gz out_R1.fastq.gz out_R2.fastq.gz \\
+        --sample SC123 --reads 10000 --seed 1 --record pilot_sampling/SC123.tsv
+"""
+
+import argparse
+import gzip
+import math
+import sys
+import zlib
+
+import numpy as np
+
+RECORD_FIELDS = ['sample', 'method', 'reads', 'fraction', 'seed', 'pairs_in', 'pairs_out']
+
+
+def records(path):
+    """Yield 4-line fastq records (as tuples of bytes) from a gzipped fastq."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            rec = (f.readline(), f.readline(), f.readline(), f.readline())
+            if not rec[0]:
+                return
+            if not rec[3]:
+                raise ValueError('%s: truncated fastq record %r' % (path, rec[0]))
+            yield rec
+
+
+def read_name(header):
+    """Read name from a header line, without any /1 or /2 mate suffix."""
+    name = header.split(None, 1)[0]
+    return name[:-2] if name[-2:] in (b'/1', b'/2') else name
+
+
+def pairs(fq1, fq2, check_mates=True):
+    """Yield (R1 record, R2 record) from two fastqs in lockstep."""
+    r2 = records(fq2)
+    for a in records(fq1):
+        b = next(r2, None)
+        if b is None:
+            raise ValueError('%s has more reads than %s' % (fq1, fq2))
+        if check_mates and read_name(a[0]) != read_name(b[0]):
+            raise ValueError('mates out of order: %r in %s, %r in %s' % (a[0], fq1, b[0], fq2))
+        yield a, b
+    if next(r2, None) is not None:
+        raise ValueError('%s has more reads than %s' % (fq2, fq1))
+
+
+def sample_seed(seed, sample):
+    return [seed, zlib.crc32(sample.encode())]
+
+
+def reservoir(items, k, rng):
+    """Uniform sample of k items as [(index, item), ...] in input order (algorithm L)."""
+    kept = []
+    if k <= 0:
+        for _ in items:
+            pass
+        return kept, 0
+    w = 1.0
+    skip = None
+    n = 0
+    for n, item in enumerate(items, 1):
+        if n <= k:
+            kept.append((n, item))
+            if n == k:
+                w = math.exp(math.log(rng.random_sample()) / k)
+                skip = n + math.floor(math.log(rng.random_sample()) / math.log1p(-w)) + 1
+            continue
+        if n == skip:
+            kept[rng.randint(k)] = (n, item)
+            w *= math.exp(math.log(rng.random_sample()) / k)
+            skip = n + math.floor(math.log(rng.random_sample()) / math.log1p(-w)) + 1
+    kept.sort(key=lambda x: x[0])
+    return kept, n
+
+
+def bernoulli(items, fraction, rng, block=1 << 16):
+    """Yield items kept independently with probability fraction."""
+    u = rng.random_sample(block)
+    i = 0
+    for item in items:
+        if i == block:
+            u, i = rng.random_sample(block), 0
+        if u[i] < fraction:
+            yield item
+        i += 1
+
+
+def subsample(fq1, fq2, out1, out2, sample, reads=0, fraction=0, seed=1, check_mates=True):
+    """Write a subset of read pairs and return the sampling record as a dict."""
+    rng = np.random.RandomState(sample_seed(seed, sample))
+    counted = [0]
+
+    def counting(it):
+        for x in it:
+            counted[0] += 1
+            yield x
+
+    source = counting(pairs(fq1, fq2, check_mates))
+    if fraction:
+        kept = bernoulli(source, fraction, rng)
+        method = 'fraction'
+    else:
+        kept = (p for _, p in reservoir(source, reads, rng)[0])
+        method = 'reads'
+    n_out = 0
+    with gzip.open(out1, 'wb', compresslevel=6) as o1, gzip.open(out2, 'wb', compresslevel=6) as o2:
+        for a, b in kept:
+            o1.write(b''.join(a))
+            o2.write(b''.join(b))
+            n_out += 1
+    return {'sample': sample, 'method': method, 'reads': reads, 'fraction': fraction, 'seed': seed,
+            'pairs_in': counted[0], 'pairs_out': n_out}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Keep a deterministic subset of read pairs from paired fastqs.')
+    p.add_argument('fq1')
+    p.add_argument('fq2')
+    p.add_argument('out1')
+    p.add_argument('out2')
+    p.add_argument('--sample', required=True, help='sample ID; mixed into the seed')
+    p.add_argument('--reads', type=int, default=10000, help='read pairs to keep per sample (default: %(default)s)')
+    p.add_argument('--fraction', type=float, default=0,
+                   help='keep each pair with this probability instead of a fixed count')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--no-check-mates', dest='check_mates', action='store_false',
+                   help='do not require matching read names in R1 and R2')
+    p.add_argument('--record', help='write the sampling parameters and counts to this TSV')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not 0 <= args.fraction <= 1:
+        sys.exit('ERROR: --fraction must be between 0 and 1')
+    rec = subsample(args.fq1, args.fq2, args.out1, args.out2, args.sample,
+                    args.reads, args.fraction, args.seed, args.check_mates)
+    if args.record:
+        with open(args.record, 'w') as f:
+            f.write('\t'.join(RECORD_FIELDS) + '\n')
+            f.write('\t'.join(str(rec[k]) for k in RECORD_FIELDS) + '\n')
+    print('%s: kept %d of %d read pairs' % (args.sample, rec['pairs_out'], rec['pairs_in']))
+
+
+if __name__ == '__main__':
+    main()
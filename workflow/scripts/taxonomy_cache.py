@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""Per-feature cache of taxonomic classifications.
+
+AUTHORS:
+    B. Ballew
+
+Feature IDs from DADA2 are the MD5 of the sequence, and classify-sklearn
+classifies each sequence independently of the others it is given.  So
+a feature classified once against a classifier never needs classifying
+again, whichever project or run it turns up in.  With
+taxonomy_cache_dir set, the classification rules only classify the
+features not already in the cache for their classifier, and assemble
+the taxonomy for every feature from the cache.  Batch runs (batch.py)
+classify the union of all projects' new features in one job per
+classifier first, so each project then only reads the cache.
+
+Layout:
+    <cache_dir>/<key>/taxonomy.tsv   Feature ID, Taxon, Confidence, as
+                                     written by the classifier
+    <cache_dir>/<key>/entry.json     classifier path, method, version
+where key is a hash of the classifier's contents, the classification
+method, and the QIIME2 version.  Rows are only ever appended, under a
+lock, so concurrent jobs can share a cache.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+from q2_artifacts import data_member
+
+BLOCK = 1 << 20
+HEADER = 'Feature ID\tTaxon\tConfidence\n'
+CLASSIFY_METHOD = 'classify-sklearn'  # shared by Snakefile and Snakefile_batch, so cache keys agree
+
+
+def classifier_key(classifier, qiime2_version, method):
+    """Hash of the classifier's contents, the method, and the QIIME2 version."""
+    h = hashlib.sha256()
+    with open(classifier, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK), b''):
+            h.update(block)
+    h.update(json.dumps({'method': method, 'qiime2_version': str(qiime2_version)}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _lines(qza, name):
+    with zipfile.ZipFile(qza) as z, z.open(data_member(z, name)) as f:
+        for line in io.TextIOWrapper(f, encoding='utf-8'):
+            yield line.rstrip('\r\n')
+
+
+def read_sequences(qza):
+    """[(feature ID, sequence), ...] from a FeatureData[Sequence] artifact, in file order."""
+    seqs, fid, parts = [], None, []
+    for line in _lines(qza, 'dna-sequences.fasta'):
+        if line.startswith('>'):
+            if fid is not None:
+                seqs.append((fid, ''.join(parts)))
+            fid, parts = line[1:].split()[0], []
+        elif line:
+            parts.append(line)
+    if fid is not None:
+        seqs.append((fid, ''.join(parts)))
+    return seqs
+
+
+def read_classification(qza):
+    """[(feature ID, taxon, confidence), ...] from a FeatureData[Taxonomy] artifact, unmodified."""
+    rows = []
+    for i, line in enumerate(_lines(qza, 'taxonomy.tsv')):
+        if i == 0 or not line or line.startswith('#'):
+            continue
+        f = line.split('\t')
+        rows.append((f[0], f[1], f[2] if len(f) > 2 else ''))
+    return rows
+
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(os.path.join(path, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class TaxonomyCache(object):
+    """Classifications by feature ID, one table per classifier key, under cache_dir."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        """{feature ID: (taxon, confidence)} for everything cached under key."""
+        if not os.path.isdir(self.entry(key)):
+            return {}
+        with _locked(self.entry(key)):
+            return self._read(key)
+
+    def _read(self, key):
+        path = os.path.join(self.entry(key), 'taxonomy.tsv')
+        if not os.path.exists(path):
+            return {}
+        found = {}
+        with open(path) as f:
+            next(f, None)
+            for line in f:
+                fid, taxon, confidence = line.rstrip('\n').split('\t')
+                found[fid] = (taxon, confidence)
+        return found
+
+    def write_missing(self, key, seqs_qzas, fasta):
+        """Write the features of seqs_qzas not yet cached under key to fasta; return how many."""
+        if isinstance(seqs_qzas, str):
+            seqs_qzas = [seqs_qzas]
+        cached = self.lookup(key)
+        seen = set(cached)
+        n = 0
+        with open(fasta, 'w') as f:
+            for qza in seqs_qzas:
+                for fid, seq in read_sequences(qza):
+                    if fid not in seen:
+                        seen.add(fid)
+                        f.write('>%s\n%s\n' % (fid, seq))
+                        n += 1
+        return n
+
+    def add(self, key, classified_qza, meta=None):
+        """Append new rows from a classifier output artifact; return how many were added."""
+        e = self.entry(key)
+        os.makedirs(e, exist_ok=True)
+        rows = read_classification(classified_qza)
+        with _locked(e):
+            cached = self._read(key)
+            new = [r for r in rows if r[0] not in cached]
+            path = os.path.join(e, 'taxonomy.tsv')
+            with open(path, 'a') as f:
+                if f.tell() == 0:
+                    f.write(HEADER)
+                f.writelines('\t'.join(r) + '\n' for r in new)
+            if meta and not os.path.exists(os.path.join(e, 'entry.json')):
+                with open(os.path.join(e, 'entry.json'), 'w') as f:
+                    json.dump(meta, f, indent=1, sort_keys=True)
+        return len(new)
+
+    def write_taxonomy(self, key, seqs_qza, tsv):
+        """Write the classification of every feature in seqs_qza, in its order, from the cache."""
+        cached = self.lookup(key)
+        ids = [fid for fid, _ in read_sequences(seqs_qza)]
+        missing = [fid for fid in ids if fid not in cached]
+        if missing:
+            raise KeyError('%d features of %s are not in the taxonomy cache, e.g. %s'
+                           % (len(missing), seqs_qza, missing[0]))
+        with open(tsv, 'w') as f:
+            f.write(HEADER)
+            f.writelines('%s\t%s\t%s\n' % ((fid,) + cached[fid]) for fid in ids)
+        return len(ids)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     S. Sevilla Chill
+#     W. Zhou
+#     B. Ballew
+#
+# Unit tests for Q2Manifest.py (ported from Q2Manifest.t).
+# TO RUN: python3 -m pytest workflow/scripts/test_Q2Manifest.py
+
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import Q2Manifest as q  # noqa: E402
+
+
+def check(func, values):
+    return list(func(pd.Series(values)))
+
+
+class TestChecks(unittest.TestCase):
+
+    def test_check_allowed_sample_labels(self):
+        self.assertEqual(check(q.check_allowed_sample_labels, ['sample id', 'Sample id', '#Sample ID', '#Sample id', 'adsf']),
+                         [True, True, True, False, False])
+
+    def test_check_no_duplicates(self):
+        self.assertEqual(check(q.check_no_duplicates, ['abc', 'def', 'abc', 'abc-1']),
+                         [True, True, False, True])
+
+    def test_check_no_empty_fields(self):
+        self.assertEqual(check(q.check_no_empty_fields, [' lsfkj\t', ' \t', '']), [True, False, False])
+
+    def test_check_header_reqs(self):
+        self.assertEqual(check(q.check_header_reqs, ['asfd89.&-_', 'asfd*89.&-_', 'asfd?89.&-_', 'asfd/89.&-_', 'asfd\\89.&-_']),
+                         [True, False, False, False, False])
+
+    def test_check_sample_id_chars(self):
+        self.assertEqual(check(q.check_sample_id_chars, ['1234', 'Sc1234.-', ' Sc1234.-\t', ' sdf2 098', 'asfd98_sfd']),
+                         [True, True, True, False, False])
+
+    def test_check_sample_id_len(self):
+        self.assertEqual(check(q.check_sample_id_len, ['1234', 'Sc12312312312312312398347584771309234747836afkdjf4.-']),
+                         [True, False])
+
+    def test_check_metadata_missing(self):
+        self.assertEqual(check(q.check_metadata_missing, ['na', ' na\t', 'NA', 'nan', 'NAN', 'NaN', '']),
+                         [False, False, False, False, False, False, True])
+
+    def test_check_metadata_len(self):
+        self.assertEqual(check(q.check_metadata_len, ['12.345123123123123123123E-49', ' 12.345123123123123123123E-49', 'sdfs90\t2^830!#*.&#^s d']),
+                         [False, False, True])
+
+
+class TestManifest(unittest.TestCase):
+
+    def write(self, text):
+        f = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+        f.write(text)
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_reports_all_violations(self):
+        path = self.write('#SampleID\tRun-ID\tProject-ID\tRun-ID\tval\n'
+                          'S1\tR1\tP1\t\tNA\n'
+                          'S_2\tR1\tP1\t\t1234567890123456\n'
+                          '\n'
+                          'S1\tR2\tP1\t\t\n')
+        errors, warnings, df = q.validate(*q.read_manifest(path))
+        self.assertEqual(errors, ['ERROR: Duplicate values "Run-ID" detected in header.',
+                                  'ERROR: Sample ID "S_2" contains prohibited characters.',
+                                  'ERROR: "1234567890123456" too long.  Numeric metadata fields must have 15 or fewer characters.',
+                                  'ERROR: Duplicate sample IDs "S1" detected.'])
+        self.assertEqual(warnings, ['WARNING: Missing data must be represented as a blank field, not "NA".'])
+        self.assertEqual(list(df.index), [1, 2, 4])
+
+    def test_load_manifest(self):
+        path = self.write('#SampleID\tRun-ID\tProject-ID\r\n'
+                          '# a comment\t\t\r\n'
+                          'S1\tR1\tP1\r\n'
+                          'S2\tR2\tP1\r\n'
+                          'S3\tR1\tP2\r\n')
+        sampleDict, RUN_IDS = q.load_manifest(path, True)
+        self.assertEqual(sampleDict, {'S1': ('R1', 'P1'), 'S2': ('R2', 'P1'), 'S3': ('R1', 'P2')})
+        self.assertEqual(RUN_IDS, ['R1', 'R2'])
+
+    def test_load_manifest_missing_headers(self):
+        path = self.write('#SampleID\tRun-ID\tProject-ID\nS1\tR1\tP1\n')
+        with self.assertRaises(SystemExit) as e:
+            q.load_manifest(path, False)
+        self.assertIn('must contain headers Run-ID, Project-ID, fq1, and fq2', str(e.exception))
+
+    def test_load_manifest_duplicate_ids(self):
+        path = self.write('#SampleID\tRun-ID\tProject-ID\nS1\tR1\tP1\nS1\tR2\tP1\n')
+        with self.assertRaises(SystemExit) as e:
+            q.load_manifest(path, True)
+        self.assertEqual(str(e.exception), 'ERROR: Duplicate sample IDs "S1" detected.')
+
+
+if __name__ == '__main__':
+    unittest.main()
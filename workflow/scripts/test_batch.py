@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for batch.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_batch.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import batch as b  # noqa: E402
+
+
+def project(out_dir, samples, **config):
+    c = {'data_source': 'internal', 'fastq_abs_path': '/fastqs/', 'qiime2_version': '2019.1',
+         'dada2_denoise': {'trim_left_forward': 0}, 'reference_db': ['/refs/silva.qza']}
+    c.update(config)
+    return {'config_file': out_dir + 'config.yaml', 'config': c, 'cgr_data': True, 'out_dir': out_dir,
+            'samples': samples, 'run_ids': sorted(set(v[0] for v in samples.values()))}
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_shared_runs_are_denoised_once(self):
+        a = project('/a/', {'S1': ('RUN_A', 'P1'), 'S2': ('RUN_B', 'P1')})
+        b_ = project('/b/', {'S1': ('RUN_A', 'P1'), 'S2': ('RUN_B', 'P1'), 'S3': ('RUN_C', 'P2')})
+        c = project('/c/', {'S1': ('RUN_A', 'P1')}, dada2_denoise={'trim_left_forward': 5})
+        d = project('/d/', {'S1': ('RUN_B', 'P1'), 'S9': ('RUN_B', 'P1')})
+        self.assertEqual(b.plan_runs([a, b_, c, d]), [['RUN_A', 'RUN_B'], ['RUN_C'], ['RUN_A'], ['RUN_B']])
+
+    def test_classifiers_are_grouped_across_projects(self):
+        a = project('/a/', {}, reference_db=['/refs/silva.qza', '/refs/gg.qza'])
+        b_ = project('/b/', {}, reference_db=['/refs/silva.qza', '/other/gg.qza'], qiime2_version='2017.11')
+        caches = b.shared_caches([a, b_], '/batch/')
+        self.assertEqual(caches['taxonomy_cache_dir'], '/batch/taxonomy_cache/')
+        config = b.batch_classification_config([a, b_], '/batch/', caches)
+        self.assertEqual(config['refs'], {'silva': '/refs/silva.qza', 'gg': '/refs/gg.qza', 'gg_': '/other/gg.qza'})
+        self.assertEqual(config['seqs']['silva'], [b.classification_seqs(a), '/b/denoising/sequence_tables/merged.qza'])
+        self.assertEqual(config['seqs']['gg_'], ['/b/denoising/sequence_tables/merged.qza'])
+        self.assertEqual(config['resource_history'], '/a/run_times/resource_history.tsv')
+
+    def test_phase_splits_jobs_and_reports_failures(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        log = os.path.join(tmp, 'log')
+        invocations = [('ok', lambda jobs: b.snakemake_command('true', jobs), None, log),
+                       ('bad', lambda jobs: b.snakemake_command('false', jobs, {'x': 1}, ['t']), None, log)]
+        self.assertEqual(b.run_phase('test', invocations, 5), ['bad'])
+        with open(log) as f:
+            self.assertEqual([l for l in f.read().splitlines() if l],
+                             ['### batch test: true --jobs 2', '### batch test: false --jobs 2 --config x=1 -- t'])
+
+
+if __name__ == '__main__':
+    unittest.main()
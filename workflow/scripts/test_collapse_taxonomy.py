@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for collapse_taxonomy.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_collapse_taxonomy.py
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import collapse_taxonomy as c  # noqa: E402
+
+
+class TestCollapse(unittest.TestCase):
+
+    def test_lineages_strip_and_pad(self):
+        out = c.lineages(pd.Series(['k__Bacteria; p__A; c__B ', 'k__Archaea']), 3)
+        self.assertEqual(out.tolist(), [['k__Bacteria', 'k__Bacteria;p__A', 'k__Bacteria;p__A;c__B'],
+                                        ['k__Archaea', 'k__Archaea;__', 'k__Archaea;__;__']])
+
+    def test_lineages_pad_to_max_observed(self):
+        out = c.lineages(pd.Series(['a;b;c', 'd']), 2)
+        self.assertEqual(out.shape, (2, 3))
+
+    def test_collapse_sums_features(self):
+        m = sparse.csr_matrix(np.array([[1, 0], [2, 3], [0, 4]]))
+        taxa, collapsed = c.collapse(m, np.array(['t2', 't1', 't2'], dtype=object))
+        self.assertEqual(list(taxa), ['t1', 't2'])
+        self.assertEqual(collapsed.toarray().tolist(), [[2, 3], [1, 4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for dada2_cache.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_dada2_cache.py
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import dada2_cache as d  # noqa: E402
+
+PARAMS = {'trim_left_forward': 0, 'truncate_length_forward': 0, 'qiime2_version': '2019.1'}
+
+
+class TestDada2Cache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache = d.Dada2Cache(os.path.join(self.tmp, 'cache'))
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def write_fastq(self, name, text, mtime=0):
+        with open(self.path(name), 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb', mtime=mtime) as g:
+                g.write(text.encode())
+        return self.path(name)
+
+    def write_manifest(self, name, rows):
+        with open(self.path(name), 'w') as f:
+            f.write('sample-id,absolute-filepath,direction\n')
+            for r in rows:
+                f.write(','.join(r) + '\n')
+        return self.path(name)
+
+    def write_outputs(self, tag):
+        outputs = {}
+        for n in ('features', 'seqs', 'stats'):
+            outputs[n] = self.path(tag + n + '.qza')
+            with open(outputs[n], 'w') as f:
+                f.write(n * 100)
+        return outputs
+
+    def test_key_ignores_gzip_header_and_path(self):
+        a = self.write_fastq('a.fastq.gz', '@r1\nACGT\n+\nIIII\n', mtime=1)
+        b = self.write_fastq('b.fastq.gz', '@r1\nACGT\n+\nIIII\n', mtime=2)
+        k1 = d.cache_key('R1', self.write_manifest('m1.txt', [('S1', a, 'forward')]), PARAMS)
+        k2 = d.cache_key('R1', self.write_manifest('m2.txt', [('S1', b, 'forward')]), PARAMS)
+        self.assertEqual(k1, k2)
+
+    def test_key_changes_with_contents_mapping_and_params(self):
+        a = self.write_fastq('a.fastq.gz', '@r1\nACGT\n+\nIIII\n')
+        c = self.write_fastq('c.fastq.gz', '@r1\nACGA\n+\nIIII\n')
+        m = self.write_manifest('m.txt', [('S1', a, 'forward')])
+        base = d.cache_key('R1', m, PARAMS)
+        self.assertNotEqual(base, d.cache_key('R1', self.write_manifest('m2.txt', [('S1', c, 'forward')]), PARAMS))
+        self.assertNotEqual(base, d.cache_key('R1', self.write_manifest('m3.txt', [('S2', a, 'forward')]), PARAMS))
+        self.assertNotEqual(base, d.cache_key('R1', m, dict(PARAMS, trim_left_forward=5)))
+
+    def test_store_then_fetch(self):
+        outputs = self.write_outputs('orig_')
+        self.assertIsNone(self.cache.fetch('ab' * 32, outputs))
+        self.cache.store('ab' * 32, outputs, {'run_id': 'R1'})
+        new = {n: self.path('new_' + n + '.qza') for n in outputs}
+        self.assertEqual(self.cache.fetch('ab' * 32, new), 'linked')
+        for n in outputs:
+            with open(new[n]) as f:
+                self.assertEqual(f.read(), n * 100)
+        self.assertEqual(self.cache.usage()[0], 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 3500  # two entries of 1700 bytes
+        first = self.write_outputs('a_')
+        self.cache.store('aa' * 32, first, {})
+        time.sleep(0.01)
+        self.cache.store('bb' * 32, self.write_outputs('b_'), {})
+        time.sleep(0.01)
+        self.cache.fetch('aa' * 32, first)
+        evicted = self.cache.store('cc' * 32, self.write_outputs('c_'), {})
+        self.assertEqual([os.path.basename(e) for e in evicted], ['bb' * 32])
+        self.assertEqual(self.cache.usage()[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for distance_matrix.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_distance_matrix.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import distance_matrix as d  # noqa: E402
+
+
+class TestDistanceMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        rng = np.random.RandomState(0)
+        self.ids = ['S%d' % i for i in range(7)]
+        self.square = squareform(pdist(rng.rand(7, 3)))
+        qza = os.path.join(self.tmp, 'bray-curtis_dist.qza')
+        rows = ['\t' + '\t'.join(self.ids)]
+        rows += [s + '\t' + '\t'.join(repr(float(x)) for x in r) for s, r in zip(self.ids, self.square)]
+        with zipfile.ZipFile(qza, 'w') as z:
+            z.writestr('0000-uuid/metadata.yaml', 'type: DistanceMatrix\n')
+            z.writestr('0000-uuid/data/distance-matrix.tsv', '\n'.join(rows) + '\n')
+        self.prefix = os.path.join(self.tmp, 'bray-curtis_dist')
+        self.assertEqual(d.export(qza, self.prefix), 7)
+
+    def test_matches_scipy_condensed_order(self):
+        cond = np.load(self.prefix + d.SUFFIX, mmap_mode='r')
+        np.testing.assert_array_equal(cond, squareform(self.square, checks=False))
+
+    def test_subsets_and_rows(self):
+        dm = d.CondensedDistanceMatrix(self.prefix + d.SUFFIX)
+        self.assertEqual(len(dm), 7)
+        self.assertEqual(dm.distance('S5', 'S2'), self.square[5, 2])
+        self.assertEqual(dm.distance('S3', 'S3'), 0.0)
+        sub = dm.subset(['S6', 'S1', 'S4'])
+        np.testing.assert_array_equal(sub.values, self.square[np.ix_([6, 1, 4], [6, 1, 4])])
+        self.assertEqual(list(sub.index), ['S6', 'S1', 'S4'])
+        np.testing.assert_array_equal(dm.row('S0').values, self.square[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for quality_profile.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_quality_profile.py
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import quality_profile as q  # noqa: E402
+
+
+def quals(scores):
+    return ''.join(chr(s + 33) for s in scores)
+
+
+class TestQualityProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write_fastq(self, name, reads):
+        path = os.path.join(self.tmp, name)
+        with gzip.open(path, 'wt') as f:
+            for i, scores in enumerate(reads):
+                f.write('@r%d\n%s\n+\n%s\n' % (i, 'A' * len(scores), quals(scores)))
+        return path
+
+    def test_histogram_counts_every_read_across_blocks(self):
+        reads = [[30] * 10 + [10] * 5, [20] * 7] * 500
+        path = self.write_fastq('a.fastq.gz', reads)
+        blocks = list(q.quality_lines(path, block_size=1000))
+        self.assertGreater(len(blocks), 10)
+        self.assertEqual(sum(map(len, blocks)), 1000)
+        h = q.histogram(path)
+        self.assertEqual(h[0].sum(), 1000)
+        self.assertEqual((h[0, 30], h[0, 20], h[12, 10], h[7].sum()), (500, 500, 500, 500))
+
+    def test_profile_run_sums_samples_by_direction(self):
+        fastqs = [('forward', self.write_fastq('s1_R1.fastq.gz', [[35] * 5] * 3)),
+                  ('forward', self.write_fastq('s2_R1.fastq.gz', [[35] * 5] * 4)),
+                  ('reverse', self.write_fastq('s1_R2.fastq.gz', [[25] * 5] * 2))]
+        hists = q.profile_run(fastqs, threads=2)
+        self.assertEqual((hists['forward'][0, 35], hists['reverse'][0, 25]), (7, 2))
+        df = q.summarize(hists['forward'])
+        self.assertEqual(df['q50'].tolist(), [35] * 5)
+
+    def hist(self, scores, n=100):
+        h = np.zeros((q.MAX_LENGTH, q.NUM_SCORES), dtype=np.int64)
+        h[np.arange(len(scores)), scores] = n
+        return h
+
+    def test_truncates_where_quality_drops(self):
+        fwd = self.hist([20] * 3 + [35] * 147 + [15] * 101)
+        rev = self.hist([35] * 200 + [15] * 51)
+        params, notes = q.suggest(fwd, rev, {'amplicon_length': 292, 'min_overlap': 12})
+        self.assertEqual(params, {'trim_left_forward': 3, 'trim_left_reverse': 0,
+                                  'truncate_length_forward': 150, 'truncate_length_reverse': 200})
+        self.assertIn('overlap: 58', notes[-1])
+
+    def test_extends_truncation_to_keep_overlap(self):
+        fwd = self.hist([35] * 100 + [20] * 50 + [10] * 101)
+        rev = self.hist([35] * 100 + [15] * 151)
+        params, notes = q.suggest(fwd, rev, {'amplicon_length': 250, 'min_overlap': 20})
+        # all of the Q20 forward tail, then the Q15 reverse tail over the Q10 forward bases
+        self.assertEqual((params['truncate_length_forward'], params['truncate_length_reverse']), (150, 120))
+        params, notes = q.suggest(fwd, rev, {'amplicon_length': 500, 'min_overlap': 20})
+        self.assertEqual((params['truncate_length_forward'], params['truncate_length_reverse']), (251, 251))
+        self.assertTrue(notes[-1].startswith('WARNING'))
+
+
+if __name__ == '__main__':
+    unittest.main()
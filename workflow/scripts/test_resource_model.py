@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for resource_model.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_resource_model.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import resource_model as r  # noqa: E402
+
+
+class TestResourceModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.history = os.path.join(self.tmp, 'resource_history.tsv')
+
+    def write_history(self, rows):
+        pd.DataFrame(rows, columns=r.HISTORY_COLUMNS).to_csv(self.history, sep='\t', index=False)
+
+    def test_defaults_without_history(self):
+        m = r.ResourceModel(self.tmp, self.history, {'max_threads': 4})
+        self.assertEqual(m.predict_threads('dada2_denoise', 1e9, 8), 4)
+        self.assertEqual(m.predict_mem_mb('dada2_denoise', 1e9), 8000)
+        self.assertEqual(m.predict_mem_mb('dada2_denoise', 1e9, attempt=2), 16000)
+
+    def test_scales_with_input_size(self):
+        # cpu time and rss both linear in input size, perfect efficiency
+        self.write_history([['dada2_denoise', 'b%d' % i, i, n, 4, n / 1e6 / 4, n / 1e6, n / 1e6]
+                            for i, n in enumerate([1e8, 1e9, 1e10])])
+        m = r.ResourceModel(self.tmp, self.history, {'target_runtime_min': 10, 'max_threads': 32,
+                                                     'max_mem_mb': 1e6, 'safety': 1.0})
+        self.assertAlmostEqual(m.predict_mem_mb('dada2_denoise', 4e9), 4000, delta=2)
+        self.assertEqual(m.predict_threads('dada2_denoise', 5.9e9, 8), 10)
+        self.assertAlmostEqual(m.predict_runtime('dada2_denoise', 5.9e9, 10), 10, delta=1)
+        self.assertEqual(m.predict_threads('dada2_denoise', 1e12, 8), 32)
+
+    def test_harvest_appends_new_benchmarks(self):
+        m = r.ResourceModel(self.tmp, self.history)
+        bench_dir = os.path.join(self.tmp, 'dada2_denoise')
+        os.makedirs(bench_dir)
+        with open(os.path.join(bench_dir, 'R1.tsv'), 'w') as f:
+            f.write('s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n'
+                    '10.0\t0:00:10\t500.0\t1\t1\t1\t0\t0\t0\t35.0\n')
+        rule = m.rule('dada2_denoise', 8, size=lambda w: 12345)
+        rule.runtime(['R1'], [], 4, 1)
+        rule.runtime(['R2'], [], 4, 1)  # no benchmark written
+        self.assertEqual(m.harvest(), 1)
+        h = pd.read_csv(self.history, sep='\t')
+        self.assertEqual(h[['rule', 'input_bytes', 'threads', 'max_rss', 'cpu_time']].values.tolist(),
+                         [['dada2_denoise', 12345, 4, 500.0, 35.0]])
+
+    def test_cache_hits_not_harvested(self):
+        m = r.ResourceModel(self.tmp, self.history)
+        bench_dir = os.path.join(self.tmp, 'dada2_denoise')
+        os.makedirs(bench_dir)
+        for run in ('R1', 'R2'):
+            with open(os.path.join(bench_dir, run + '.tsv'), 'w') as f:
+                f.write('s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n'
+                        '2.0\t0:00:02\t50.0\t1\t1\t1\t0\t0\t0\t1.0\n')
+        rule = m.rule('dada2_denoise', 8, size=lambda w: 12345)
+        rule.runtime(['R1'], [], 4, 1)
+        rule.runtime(['R2'], [], 4, 1)
+        rule.mark_cached(['R1'])
+        rule.mark_cached(['R2'])
+        rule.mark_cached(['R2'], False)  # re-run for real after an earlier hit
+        self.assertEqual(m.harvest(), 1)
+        self.assertEqual(pd.read_csv(self.history, sep='\t')['benchmark'].tolist(), [os.path.join(bench_dir, 'R2.tsv')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for sparse_feature_table.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_sparse_feature_table.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import biom
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sparse_feature_table as s  # noqa: E402
+
+
+class TestSparseFeatureTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.counts = np.array([[0, 3, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0], [5, 2, 0, 7], [0, 0, 0, 4]])
+        self.features = ['f%d' % i for i in range(5)]
+        self.samples = ['S%d' % i for i in range(4)]
+        table = biom.Table(self.counts, self.features, self.samples)
+        biom_path = os.path.join(self.tmp, 'feature-table.biom')
+        with biom.util.biom_open(biom_path, 'w') as f:
+            table.to_hdf5(f, 'test')
+        self.out = os.path.join(self.tmp, 'feature-table.sparse.h5')
+        s.export(biom_path, self.out, chunk_rows=2)
+
+    def test_round_trip(self):
+        with s.SparseFeatureTable(self.out) as t:
+            self.assertEqual(t.shape, (5, 4))
+            self.assertEqual(list(t.features), self.features)
+            self.assertEqual(list(t.samples), self.samples)
+            self.assertEqual(t.to_scipy().toarray().tolist(), self.counts.tolist())
+
+    def test_slices(self):
+        with s.SparseFeatureTable(self.out) as t:
+            self.assertEqual(t.feature_slice(['f3', 'f0']).values.tolist(), [[5, 2, 0, 7], [0, 3, 0, 0]])
+            self.assertEqual(t.sample_slice(['S2', 'S3']).values.tolist(), self.counts[:, [2, 3]].tolist())
+
+    def test_sample_totals_with_empty_columns(self):
+        with s.SparseFeatureTable(self.out) as t:
+            self.assertEqual(t.sample_totals().tolist(), self.counts.sum(axis=0).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for stage.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_stage.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import stage as st  # noqa: E402
+
+
+class TestStage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.out_dir = os.path.join(self.tmp, 'out') + '/'
+        self.scratch = os.path.join(self.tmp, 'scratch')
+        os.makedirs(self.out_dir + 'tables')
+        self.ref = os.path.join(self.tmp, 'refs', 'classifier.qza')
+        os.makedirs(os.path.dirname(self.ref))
+        for path, text in [(self.out_dir + 'tables/merged.qza', 'table'), (self.ref, 'classifier')]:
+            with open(path, 'w') as f:
+                f.write(text)
+
+    def run_stage(self, cmd, outputs):
+        inputs = [self.out_dir + 'tables/merged.qza', self.ref]
+        return st.stage(cmd.format(i=' '.join(inputs), o=' '.join(outputs)), self.scratch, self.out_dir,
+                        inputs, outputs)
+
+    def test_rewrite(self):
+        cmd = st.rewrite('x ' + self.out_dir + 'a.qza ' + self.ref, '/s/job', self.out_dir, [self.ref])
+        self.assertEqual(cmd.split()[1], '/s/job/out/a.qza')
+        self.assertTrue(cmd.split()[2].startswith('/s/job/ext/'))
+
+    def test_runs_in_scratch_and_returns_outputs(self):
+        out = self.out_dir + 'taxa/orig.qza'
+        code, rec = self.run_stage('cat {i} > {o}', [out])
+        self.assertEqual(code, 0)
+        with open(out) as f:
+            self.assertEqual(f.read(), 'tableclassifier')
+        self.assertEqual((rec['bytes_fetched'], rec['bytes_reused'], rec['bytes_returned']), (15, 0, 15))
+        self.assertEqual(os.listdir(os.path.join(self.scratch, 'jobs')), [])
+
+    def test_inputs_fetched_once_per_node(self):
+        self.run_stage('cat {i} > {o}', [self.out_dir + 'a.txt'])
+        code, rec = self.run_stage('cat {i} > {o}', [self.out_dir + 'b.txt'])
+        self.assertEqual((rec['bytes_fetched'], rec['bytes_reused']), (0, 15))
+
+    def test_changed_input_refetched(self):
+        self.run_stage('cat {i} > {o}', [self.out_dir + 'a.txt'])
+        with open(self.ref, 'w') as f:
+            f.write('classifier v2')
+        code, rec = self.run_stage('cat {i} > {o}', [self.out_dir + 'b.txt'])
+        self.assertEqual((rec['bytes_fetched'], rec['bytes_reused']), (13, 5))
+        self.assertEqual(len([f for f in os.listdir(os.path.join(self.scratch, 'inputs'))
+                              if f.endswith('classifier.qza')]), 1)
+
+    def test_evict_skips_entries_in_use(self):
+        cache_dir = os.path.join(self.scratch, 'inputs')
+        os.makedirs(cache_dir)
+        local, _ = st.fetch(cache_dir, self.ref, os.path.join(self.tmp, 'job', 'classifier.qza'))
+        prefix = os.path.basename(local).split('.', 1)[0]
+        with st._locked(os.path.join(cache_dir, prefix + '.lock')):
+            st.evict(cache_dir, 0, set())
+            self.assertTrue(os.path.exists(local))
+        st.evict(cache_dir, 0, set())
+        self.assertFalse(os.path.exists(local))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'job', 'classifier.qza')))
+
+    def test_failure_leaves_no_output(self):
+        out = self.out_dir + 'taxa/orig.qza'
+        code, rec = self.run_stage('cat {i} > {o}; false', [out])
+        self.assertNotEqual(code, 0)
+        self.assertFalse(os.path.exists(out))
+
+    def test_record_named_like_benchmark(self):
+        d = os.path.join(self.tmp, 'run_times', 'condense_distance_matrix')
+        self.assertEqual(st.record_name(d, ['silva', 'jaccard']), 'silva_jaccard')
+        self.assertEqual(st.record_name(d, ['metric=jaccard,ref=silva']), 'jaccard_silva')
+        os.makedirs(d)
+        open(os.path.join(d, 'silva_jaccard.tsv'), 'w').close()
+        self.assertEqual(st.record_name(d, ['metric=jaccard,ref=silva']), 'silva_jaccard')
+        self.assertEqual(st.record_name(d, []), 'condense_distance_matrix')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for subsample_fastq.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_subsample_fastq.py
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import subsample_fastq as s  # noqa: E402
+
+
+class TestSubsampleFastq(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.fq1 = self.write_fastq('in_R1.fastq.gz', 1, 1000)
+        self.fq2 = self.write_fastq('in_R2.fastq.gz', 2, 1000)
+
+    def write_fastq(self, name, mate, n, names=None):
+        path = os.path.join(self.tmp, name)
+        with gzip.open(path, 'wt') as f:
+            for i in range(n):
+                f.write('@M0:1:%d %d:N:0:1\nACGT\n+\nIIII\n' % (names[i] if names else i, mate))
+        return path
+
+    def names(self, path):
+        with gzip.open(path, 'rt') as f:
+            return [line.split()[0] for line in f][::4]
+
+    def run_subsample(self, tag, **kw):
+        out1 = os.path.join(self.tmp, tag + '_R1.fastq.gz')
+        out2 = os.path.join(self.tmp, tag + '_R2.fastq.gz')
+        rec = s.subsample(self.fq1, self.fq2, out1, out2, 'SC1', **kw)
+        return rec, self.names(out1), self.names(out2)
+
+    def test_reservoir_keeps_pairs_in_order_and_is_seeded(self):
+        rec, r1, r2 = self.run_subsample('a', reads=100, seed=7)
+        self.assertEqual((rec['pairs_in'], rec['pairs_out']), (1000, 100))
+        self.assertEqual(r1, r2)
+        idx = [int(n.rsplit(':', 1)[1]) for n in r1]
+        self.assertEqual(idx, sorted(set(idx)))
+        self.assertEqual(self.run_subsample('b', reads=100, seed=7)[1], r1)
+        self.assertNotEqual(self.run_subsample('c', reads=100, seed=8)[1], r1)
+        self.assertEqual(self.run_subsample('d', reads=5000)[0]['pairs_out'], 1000)
+
+    def test_reservoir_is_uniform(self):
+        counts = np.zeros(50)
+        rng = np.random.RandomState(0)
+        for _ in range(2000):
+            for i, _ in s.reservoir(iter(range(50)), 10, rng)[0]:
+                counts[i - 1] += 1
+        self.assertLess(abs(counts / 2000 - 0.2).max(), 0.05)
+
+    def test_fraction_and_mate_check(self):
+        rec, r1, r2 = self.run_subsample('a', fraction=0.25, seed=3)
+        self.assertEqual(rec['method'], 'fraction')
+        self.assertEqual(r1, r2)
+        self.assertTrue(200 < rec['pairs_out'] < 300)
+        self.fq2 = self.write_fastq('bad_R2.fastq.gz', 2, 1000, names=[0, 2, 1] + list(range(3, 1000)))
+        with self.assertRaises(ValueError):
+            self.run_subsample('b', reads=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
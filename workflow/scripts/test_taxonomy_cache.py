@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for taxonomy_cache.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_taxonomy_cache.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import taxonomy_cache as t  # noqa: E402
+
+
+class TestTaxonomyCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache = t.TaxonomyCache(self.path('cache'))
+        self.classifier = self.path('classifier.qza')
+        with open(self.classifier, 'wb') as f:
+            f.write(b'classifier')
+        self.key = t.classifier_key(self.classifier, '2019.1', 'classify-sklearn')
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def artifact(self, name, member, text):
+        with zipfile.ZipFile(self.path(name), 'w') as z:
+            z.writestr('0000-uuid/data/' + member, text)
+        return self.path(name)
+
+    def seqs(self, name, ids):
+        return self.artifact(name, 'dna-sequences.fasta', ''.join('>%s\nACGT%s\nTT\n' % (i, i) for i in ids))
+
+    def classified(self, name, ids):
+        return self.artifact(name, 'taxonomy.tsv', t.HEADER + ''.join(
+            '%s\tk__Bacteria; p__%s \t0.9%s\n' % (i, i, i) for i in ids))
+
+    def test_key_depends_on_contents_and_version(self):
+        self.assertNotEqual(self.key, t.classifier_key(self.classifier, '2017.11', 'classify-sklearn'))
+        with open(self.classifier, 'ab') as f:
+            f.write(b'!')
+        self.assertNotEqual(self.key, t.classifier_key(self.classifier, '2019.1', 'classify-sklearn'))
+
+    def test_classifies_only_new_features_across_projects(self):
+        a = self.seqs('a.qza', ['f1', 'f2', 'f3'])
+        b = self.seqs('b.qza', ['f3', 'f4', 'f1'])
+        fasta = self.path('missing.fasta')
+        self.assertEqual(self.cache.write_missing(self.key, [a, b], fasta), 4)
+        self.assertEqual(self.cache.add(self.key, self.classified('c1.qza', ['f1', 'f2', 'f3'])), 3)
+        self.assertEqual(self.cache.write_missing(self.key, b, fasta), 1)
+        with open(fasta) as f:
+            self.assertEqual(f.read(), '>f4\nACGTf4TT\n')
+        with self.assertRaises(KeyError):
+            self.cache.write_taxonomy(self.key, b, self.path('b.tsv'))
+        self.assertEqual(self.cache.add(self.key, self.classified('c2.qza', ['f4', 'f1'])), 1)
+        self.cache.write_taxonomy(self.key, b, self.path('b.tsv'))
+        with open(self.path('b.tsv')) as f:
+            self.assertEqual(f.read(), t.HEADER + 'f3\tk__Bacteria; p__f3 \t0.9f3\n'
+                             'f4\tk__Bacteria; p__f4 \t0.9f4\nf1\tk__Bacteria; p__f1 \t0.9f1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for timeline.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_timeline.py
+
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import timeline as t  # noqa: E402
+
+
+def job(rule, start, end, host='node1', threads=1, wildcards=None, samples=()):
+    return {'rule': rule, 'wildcards': dict(wildcards or {}), 'host': host, 'threads': threads, 'start': start,
+            'end': end, 'exit': 0, 'cpu': 0, 'max_rss': 0, 'samples': list(samples)}
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_run_records_samples_and_exit_code(self):
+        code = t.run('python3 -c "x = bytearray(50 * 10**6); sum(range(5 * 10**7))"; exit 3',
+                     self.tmp, 'dada2_denoise', {'runID': 'R1'}, 4, 0.05)
+        self.assertEqual(code, 3)
+        path, = glob.glob(os.path.join(self.tmp, 'jobs', 'dada2_denoise-R1-*.jsonl'))
+        j = t.read_job(path)
+        self.assertEqual((j['rule'], j['wildcards'], j['threads'], j['exit']), ('dada2_denoise', {'runID': 'R1'}, 4, 3))
+        self.assertGreater(len(j['samples']), 1)
+        self.assertGreater(max(s['rss'] for s in j['samples']), 50e6)
+        self.assertGreater(j['max_rss'], 50e6)
+        self.assertGreater(j['cpu'], 0)
+        self.assertGreaterEqual(j['end'], j['samples'][-1]['t'])
+
+    def test_killed_job_ends_at_last_sample(self):
+        os.makedirs(os.path.join(self.tmp, 'jobs'))
+        path = os.path.join(self.tmp, 'jobs', 'r-x-h-1.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'rule': 'r', 'wildcards': {}, 'host': 'h', 'threads': 1, 'start': 10}) + '\n')
+            f.write(json.dumps({'t': 15, 'cpu': 4, 'rss': 1e6, 'read': 0, 'write': 0}) + '\n')
+            f.write('{"t": 20, "cpu"')  # cut off mid-write
+        j = t.read_job(path)
+        self.assertEqual((j['end'], j['exit']), (15, 'killed'))
+
+    def test_concurrent_jobs_get_separate_lanes_and_queue_time(self):
+        jobs = [job('a', 0, 10), job('b', 5, 15, wildcards={'runID': 'R1'}), job('c', 12, 20), job('d', 0, 3, host='node2')]
+        submits = [{'rule': 'b', 'wildcards': {'runID': 'R1'}, 'submit': 1}]
+        events = t.chrome_trace(jobs, submits)['traceEvents']
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(spans['a']['tid'], spans['c']['tid'])
+        self.assertNotEqual(spans['a']['tid'], spans['b R1']['tid'])
+        self.assertNotEqual(spans['a']['pid'], spans['d']['pid'])
+        self.assertEqual((spans['queued: b']['pid'], spans['queued: b']['dur']), (0, 4e6))
+
+    def test_host_counters_sum_running_jobs(self):
+        samples = [{'t': 2, 'cpu': 4, 'rss': 100e6, 'read': 0, 'write': 0}]
+        jobs = [job('a', 0, 10, threads=4, samples=samples), job('b', 1, 5, threads=2)]
+        cores = [e for e in t.chrome_trace(jobs, [])['traceEvents'] if e.get('name') == 'cores']
+        at = {e['ts'] / 1e6: e['args'] for e in cores}
+        self.assertEqual(at[2], {'in use': 2.0, 'reserved': 6})
+        self.assertEqual(at[10], {'in use': 0.0, 'reserved': 0})
+
+    def test_submit_reads_jobscript_properties(self):
+        script = os.path.join(self.tmp, 'snakejob.sh')
+        with open(script, 'w') as f:
+            f.write('#!/bin/sh\n# properties = {"rule": "dada2_denoise", "wildcards": {"runID": "R1"}}\n')
+        self.assertEqual(t.job_properties(script), ('dada2_denoise', {'runID': 'R1'}))
+
+    def test_multi_wildcard_jobs_match_their_submit_records(self):
+        script = os.path.join(self.tmp, 'snakejob.sh')
+        with open(script, 'w') as f:
+            f.write('#!/bin/sh\n# properties = {"rule": "condense_distance_matrix", '
+                    '"wildcards": {"ref": "silva", "metric": "jaccard"}}\n')
+        rule, wildcards = t.job_properties(script)
+        submits = [{'rule': rule, 'wildcards': wildcards, 'submit': 1}]
+        for tokens in (['metric=jaccard,ref=silva'], ['silva', 'jaccard']):
+            jobs = [job('condense_distance_matrix', 5, 9, wildcards=t.parse_wildcards(tokens))]
+            queued = [e for e in t.chrome_trace(jobs, submits)['traceEvents'] if e.get('cat') == 'queued']
+            self.assertEqual([e['dur'] for e in queued], [4e6], tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()
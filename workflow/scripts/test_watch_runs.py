@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# CGR QIIME2 pipeline for microbiome analysis.
+#
+# AUTHORS:
+#     B. Ballew
+#
+# Unit tests for watch_runs.py.
+# TO RUN: python3 -m pytest workflow/scripts/test_watch_runs.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import watch_runs as w  # noqa: E402
+
+
+class TestWatchRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.fastqs = self.tmp + '/fastqs/'
+        self.samples = {'S1': ('RUN_A', 'P1'), 'S2': ('RUN_A', 'P1'), 'S3': ('RUN_B', 'P1')}
+        self.runs = w.run_fastqs(self.samples, True, self.fastqs)
+
+    def land(self, sample, run, size=10):
+        d = '%s%s/CASAVA/L1/Project_P1/Sample_%s/' % (self.fastqs, run, sample)
+        os.makedirs(d, exist_ok=True)
+        for r in ('R1', 'R2'):
+            with open(d + '%s_S1_L001_%s_001.fastq.gz' % (sample, r), 'wb') as f:
+                f.write(b'x' * size)
+
+    def test_ready_when_all_samples_land_and_sizes_settle(self):
+        self.assertEqual(len(self.runs['RUN_A']), 4)
+        watcher = w.RunWatcher(self.runs, self.tmp + '/watch/')
+        self.land('S1', 'RUN_A')
+        self.assertFalse(watcher.ready('RUN_A'))
+        self.land('S2', 'RUN_A', 5)
+        self.assertFalse(watcher.ready('RUN_A'))  # first sighting
+        self.land('S2', 'RUN_A', 8)
+        self.assertFalse(watcher.ready('RUN_A'))  # still growing
+        self.assertTrue(watcher.ready('RUN_A'))
+        marked = w.RunWatcher(self.runs, self.tmp + '/watch/', self.fastqs + '{runID}/done.txt')
+        self.assertFalse(marked.ready('RUN_A'))
+        open(self.fastqs + 'RUN_A/done.txt', 'w').close()
+        self.assertTrue(marked.ready('RUN_A'))
+
+    def test_watch_runs_branches_and_resumes(self):
+        marker = self.fastqs + '{runID}/done.txt'
+        for s, (r, _) in self.samples.items():
+            self.land(s, r)
+            open(self.fastqs + r + '/done.txt', 'w').close()
+        watcher = w.RunWatcher(self.runs, self.tmp + '/watch/', marker)
+        self.assertEqual(w.watch(watcher, ['RUN_A', 'RUN_B'], 'false', self.tmp, interval=0.01), ['RUN_A', 'RUN_B'])
+        os.remove(self.tmp + '/watch_RUN_A.out')
+        watcher.mark_done('RUN_A')
+        self.assertEqual(w.watch(watcher, ['RUN_A', 'RUN_B'], 'true', self.tmp, interval=0.01), [])
+        self.assertTrue(watcher.done('RUN_B'))
+        self.assertFalse(os.path.exists(self.tmp + '/watch_RUN_A.out'))  # not re-run after restart
+
+    def test_branches_share_the_job_budget(self):
+        for s, (r, _) in self.samples.items():
+            self.land(s, r)
+            open(self.fastqs + r + '/done.txt', 'w').close()
+        watcher = w.RunWatcher(self.runs, self.tmp + '/watch/', self.fastqs + '{runID}/done.txt')
+        self.assertEqual(w.watch(watcher, ['RUN_A', 'RUN_B'], 'true', self.tmp, interval=0.01, jobs=10, branches=2), [])
+        for r in ('RUN_A', 'RUN_B'):
+            with open(self.tmp + '/watch_%s.out' % r) as f:
+                self.assertIn('true --jobs 5 --nolock --config only_run_ids=%s -- per_run' % r, f.read())
+
+    def test_gives_up_on_missing_runs(self):
+        watcher = w.RunWatcher(self.runs, self.tmp + '/watch/')
+        self.assertEqual(w.watch(watcher, ['RUN_A'], 'true', self.tmp, interval=0.01, timeout=0.05), ['RUN_A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""Per-job resource sampling and a whole-run Chrome trace timeline.
+
+AUTHORS:
+    B. Ballew
+
+Benchmark files give one summary line per job.  With trace: True in
+the config, every rule's command runs under `timeline.py run`, which
+samples the job's process tree every trace_interval seconds (CPU cores
+in use, RSS, bytes read/written) and appends the samples to
+run_times/trace/jobs/<rule>-<wildcards>-<host>-<pid>.jsonl.  In
+cluster mode, Q2_wrapper.sh puts `timeline.py submit` in front of the
+submission command to record when each job was handed to the
+scheduler.  At the end of a run, `merge` combines the records into
+run_times/timeline_<start time>.json, which loads in chrome://tracing
+or https://ui.perfetto.dev:
+
+    - one process per host, one row per concurrently running job
+      (rule and wildcards, with peak RSS, CPU and I/O in the event
+      details), and per-host counters of CPU cores in use, threads
+      reserved, and RSS, so idle cores stand out
+    - a "scheduler" process with the time each job spent queued
+      between submission and start (cluster mode only)
+    - RSS over time for each job that ran for several samples
+
+TO RUN:
+    python3 timeline.py run --trace-dir D --rule R --wildcards W --threads N <<'EOF'
+    cmd
+    EOF
+    python3 timeline.py submit D qsub ... jobscript.sh
+    python3 timeline.py merge D --since EPOCH_SECONDS --out timeline.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import psutil
+
+US = 1e6
+
+
+def _safe(s):
+    return re.sub(r'[^A-Za-z0-9_.=-]+', '_', s)[:150]
+
+
+def _tree(proc):
+    try:
+        return [proc] + proc.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+
+def sample(procs):
+    """Cumulative CPU seconds, RSS bytes, read and write bytes of a process tree."""
+    cpu = rss = rd = wr = 0
+    for p in procs:
+        try:
+            with p.oneshot():
+                t = p.cpu_times()
+                cpu += t.user + t.system + getattr(t, 'children_user', 0) + getattr(t, 'children_system', 0)
+                rss += p.memory_info().rss
+                try:
+                    io = p.io_counters()
+                    rd += io.read_bytes
+                    wr += io.write_bytes
+                except (AttributeError, psutil.AccessDenied):
+                    pass
+        except psutil.NoSuchProcess:
+            pass
+    return cpu, rss, rd, wr
+
+
+def parse_wildcards(tokens):
+    """{name: value} from --wildcards tokens.
+
+    Accepts name=value pairs (comma-separated) or bare values; bare
+    values are keyed by their position.
+    """
+    wildcards = {}
+    for token in tokens:
+        for kv in (token.split(',') if '=' in token else [token]):
+            name, sep, value = kv.partition('=')
+            if sep:
+                wildcards[name] = value
+            else:
+                wildcards[str(len(wildcards))] = kv
+    return wildcards
+
+
+def _label(wildcards):
+    return '_'.join(str(v) for v in wildcards.values())
+
+
+def _match_keys(wildcards):
+    """Keys a submit record matches jobs on: wildcards by name, and by position for jobs recorded with bare values."""
+    return {tuple(sorted(wildcards.items())), tuple((str(i), v) for i, v in enumerate(wildcards.values()))}
+
+
+def run(cmd, trace_dir, rule, wildcards, threads, interval):
+    """Run cmd under bash, sampling its process tree; returns the exit code.
+
+    wildcards is a {name: value} dict (see parse_wildcards).
+    """
+    os.makedirs(os.path.join(trace_dir, 'jobs'), exist_ok=True)
+    host = socket.gethostname()
+    path = os.path.join(trace_dir, 'jobs', '%s-%s-%s-%d.jsonl' % (rule, _safe(_label(wildcards)) or rule,
+                                                                   host, os.getpid()))
+    with open(path, 'w', buffering=1) as f:
+        start = time.time()
+        f.write(json.dumps({'rule': rule, 'wildcards': wildcards, 'host': host, 'threads': threads,
+                            'start': start}) + '\n')
+        child = subprocess.Popen(['bash', '-c', 'set -euo pipefail; ' + cmd])
+        proc = psutil.Process(child.pid)
+        last_cpu = 0
+        while True:
+            try:
+                code = child.wait(timeout=interval)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            cpu, rss, rd, wr = sample(_tree(proc))
+            last_cpu = max(cpu, last_cpu)  # CPU time of exited grandchildren is lost
+            f.write(json.dumps({'t': time.time(), 'cpu': last_cpu, 'rss': rss, 'read': rd, 'write': wr}) + '\n')
+        # totals over all reaped descendants; covers jobs shorter than one interval
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        f.write(json.dumps({'end': time.time(), 'exit': code, 'cpu': usage.ru_utime + usage.ru_stime,
+                            'max_rss': usage.ru_maxrss * 1024}) + '\n')
+    return code
+
+
+def job_properties(jobscript):
+    """(rule, {wildcard name: value}) from the properties line of a snakemake jobscript."""
+    with open(jobscript) as f:
+        for line in f:
+            if line.startswith('# properties = '):
+                props = json.loads(line[len('# properties = '):])
+                return props.get('rule', 'unknown'), {k: str(v) for k, v in props.get('wildcards', {}).items()}
+    return 'unknown', {}
+
+
+def submit(trace_dir, argv):
+    """Record the submission time of argv[-1] (a jobscript), then exec argv."""
+    rule, wildcards = job_properties(argv[-1])
+    os.makedirs(os.path.join(trace_dir, 'submit'), exist_ok=True)
+    now = time.time()
+    path = os.path.join(trace_dir, 'submit', '%s-%s-%.6f.json' % (rule, _safe(_label(wildcards)) or rule, now))
+    with open(path, 'w') as f:
+        json.dump({'rule': rule, 'wildcards': wildcards, 'submit': now}, f)
+    os.execvp(argv[0], argv)
+
+
+def read_job(path):
+    """Parse one job .jsonl into a dict with start, end, exit and samples."""
+    with open(path) as f:
+        lines = [json.loads(l) for l in f if l.strip().endswith('}')]
+    job = dict(lines[0], samples=[l for l in lines[1:] if 't' in l])
+    tail = [l for l in lines[1:] if 'end' in l]
+    last = job['samples'][-1] if job['samples'] else {}
+    if tail:
+        job.update(end=tail[0]['end'], exit=tail[0]['exit'], cpu=tail[0].get('cpu', last.get('cpu', 0)),
+                   max_rss=tail[0].get('max_rss', 0))
+    else:  # killed (e.g. by the scheduler) before it could finish the record
+        job.update(end=last.get('t', job['start']), exit='killed', cpu=last.get('cpu', 0), max_rss=0)
+    job['max_rss'] = max([job['max_rss']] + [s['rss'] for s in job['samples']])
+    return job
+
+
+def _lanes(spans):
+    """Greedy interval packing; returns a lane index per (start, end) span."""
+    ends, out = [], []
+    for s, e in spans:
+        for i, free in enumerate(ends):
+            if free <= s:
+                ends[i] = e
+                out.append(i)
+                break
+        else:
+            ends.append(e)
+            out.append(len(ends) - 1)
+    return out
+
+
+def _rates(job):
+    """Per-sample (t, cores, rss MB) derived from cumulative counters."""
+    out, prev_t, prev_cpu = [], job['start'], 0.0
+    for s in job['samples']:
+        dt = max(s['t'] - prev_t, 1e-6)
+        out.append((s['t'], max(0.0, (s['cpu'] - prev_cpu) / dt), s['rss'] / 1e6))
+        prev_t, prev_cpu = s['t'], s['cpu']
+    return out
+
+
+def chrome_trace(jobs, submits):
+    """Build Chrome trace events from job records and submit records."""
+    events = []
+    hosts = sorted(set(j['host'] for j in jobs))
+    pids = {h: i + 1 for i, h in enumerate(hosts)}
+    events.append({'ph': 'M', 'pid': 0, 'name': 'process_name', 'args': {'name': 'scheduler'}})
+    for h, pid in pids.items():
+        events.append({'ph': 'M', 'pid': pid, 'name': 'process_name', 'args': {'name': h}})
+
+    by_job = {}
+    for s in sorted(submits, key=lambda s: s['submit']):
+        for key in _match_keys(s['wildcards']):
+            by_job.setdefault((s['rule'], key), []).append(s['submit'])
+    queued = []
+    for j in jobs:
+        times = [t for t in by_job.get((j['rule'], tuple(sorted(j['wildcards'].items()))), []) if t <= j['start']]
+        if times:
+            queued.append((times[-1], j))
+
+    for lane, (t, j) in zip(_lanes([(t, j['start']) for t, j in sorted(queued, key=lambda q: q[0])]),
+                            sorted(queued, key=lambda q: q[0])):
+        events.append({'ph': 'X', 'pid': 0, 'tid': lane, 'cat': 'queued', 'name': 'queued: ' + j['rule'],
+                       'ts': t * US, 'dur': (j['start'] - t) * US, 'args': {'wildcards': j['wildcards']}})
+
+    for h in hosts:
+        hjobs = sorted((j for j in jobs if j['host'] == h), key=lambda j: j['start'])
+        changes = []
+        for lane, j in zip(_lanes([(j['start'], j['end']) for j in hjobs]), hjobs):
+            rates = _rates(j)
+            last = j['samples'][-1] if j['samples'] else {}
+            args = {'wildcards': j['wildcards'], 'threads': j['threads'], 'exit': j['exit'],
+                    'peak_rss_mb': round(j['max_rss'] / 1e6, 1),
+                    'mean_cores': round(j['cpu'] / max(j['end'] - j['start'], 1e-6), 2),
+                    'read_mb': round(last.get('read', 0) / 1e6, 1),
+                    'write_mb': round(last.get('write', 0) / 1e6, 1)}
+            events.append({'ph': 'X', 'pid': pids[h], 'tid': lane, 'cat': 'job',
+                           'name': j['rule'] + (' ' + _label(j['wildcards']) if j['wildcards'] else ''),
+                           'ts': j['start'] * US, 'dur': (j['end'] - j['start']) * US, 'args': args})
+            key = id(j)
+            changes.append((j['start'], key, 0.0, 0.0, j['threads']))
+            changes.extend((t, key, c, r, j['threads']) for t, c, r in rates)
+            changes.append((j['end'], key, 0.0, 0.0, 0))
+            if len(rates) >= 3:
+                name = 'rss MB: %s %s' % (j['rule'], _label(j['wildcards']))
+                events.extend({'ph': 'C', 'pid': pids[h], 'name': name, 'ts': t * US, 'args': {'rss': round(r, 1)}}
+                              for t, c, r in rates)
+        current = {}
+        for t, key, c, r, th in sorted(changes, key=lambda x: x[0]):
+            current[key] = (c, r, th)
+            events.append({'ph': 'C', 'pid': pids[h], 'name': 'cores', 'ts': t * US,
+                           'args': {'in use': round(sum(v[0] for v in current.values()), 2),
+                                    'reserved': sum(v[2] for v in current.values())}})
+            events.append({'ph': 'C', 'pid': pids[h], 'name': 'rss MB', 'ts': t * US,
+                           'args': {'rss': round(sum(v[1] for v in current.values()), 1)}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def merge(trace_dir, out, since=0):
+    """Write the timeline for jobs that started at or after `since`."""
+    jobs = []
+    for p in glob.glob(os.path.join(trace_dir, 'jobs', '*.jsonl')):
+        try:
+            j = read_job(p)
+        except (ValueError, IndexError, KeyError):
+            continue
+        if j['start'] >= since:
+            jobs.append(j)
+    submits = []
+    for p in glob.glob(os.path.join(trace_dir, 'submit', '*.json')):
+        with open(p) as f:
+            s = json.load(f)
+        if s['submit'] >= since:
+            submits.append(s)
+    with open(out, 'w') as f:
+        json.dump(chrome_trace(jobs, submits), f)
+    return len(jobs)
+
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(description='Per-job resource sampling and run timelines.')
+    sub = p.add_subparsers(dest='command')
+    r = sub.add_parser('run', help='run a command (read from stdin) and sample it')
+    r.add_argument('--trace-dir', required=True)
+    r.add_argument('--rule', required=True)
+    r.add_argument('--wildcards', nargs='*', default=[])
+    r.add_argument('--threads', type=int, default=1)
+    r.add_argument('--interval', type=float, default=5.0, help='seconds between samples (default: %(default)s)')
+    s = sub.add_parser('submit', help='record submission time, then run the submit command')
+    s.add_argument('trace_dir')
+    s.add_argument('submit_cmd', nargs=argparse.REMAINDER)
+    m = sub.add_parser('merge', help='write a Chrome trace JSON timeline')
+    m.add_argument('trace_dir')
+    m.add_argument('--out', required=True)
+    m.add_argument('--since', type=float, default=0, help='only jobs started after this epoch time')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'run':
+        wildcards = parse_wildcards(args.wildcards)
+        sys.exit(run(sys.stdin.read(), args.trace_dir, args.rule, wildcards, args.threads, args.interval))
+    elif args.command == 'submit':
+        submit(args.trace_dir, args.submit_cmd)
+    elif args.command == 'merge':
+        merge(args.trace_dir, args.out, args.since)
+    else:
+        sys.exit('Usage: timeline.py {run,submit,merge} ...')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""Watch mode: start each run ID's stages as soon as its fastqs land.
+
+AUTHORS:
+    B. Ballew
+
+Flowcells for one project often come off the sequencers over several
+days, but a normal run needs every fastq in the manifest up front.  In
+watch mode (watch: True), Q2_wrapper.sh runs this script instead of
+snakemake.  It:
+    1. builds the QIIME2 copy of the manifest once (check_manifest),
+    2. polls each run ID until it is complete, i.e. every sample's R1
+       and R2 fastq is present and, if watch_marker is set, the run's
+       marker file exists (otherwise, until the fastq sizes have not
+       changed since the previous poll),
+    3. launches the per-run ID branch of the DAG (target rule per_run,
+       restricted to that run ID with --config only_run_ids=<runID>)
+       for each complete run, concurrently with any still running;
+       at most watch_branches branches run at once, and each gets an
+       equal share of --jobs, so the cluster load stays within num_jobs,
+    4. once every run ID has finished, runs the whole workflow, which
+       then only has the cross-run stages left to do.
+Each finished branch writes <out_dir>/watch/<runID>.done, so a restart
+only waits for and runs the run IDs that are not done yet.  Branch
+logs go to <out_dir>/logs/watch_<runID>.out.
+
+TO RUN (normally via Q2_wrapper.sh):
+    conf=config.yaml python3 watch_runs.py --jobs 20 config.yaml 'snakemake -p -s /path/to/Snakefile ...'
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+
+import yaml
+
+from Q2Manifest import load_manifest
+
+
+def pipeline_out_dir(config):
+    """out_dir as the Snakefile resolves it (pilot runs write elsewhere)."""
+    out_dir = config['out_dir'].rstrip('/') + '/'
+    if config.get('pilot', False):
+        out_dir = (config.get('pilot_out_dir') or out_dir + 'pilot/').rstrip('/') + '/'
+    return out_dir
+
+
+def run_fastqs(sample_dict, cgr_data, fastq_abs_path=''):
+    """{runID: [fastq path or glob, ...]}, following the Snakefile's get_*_fq functions."""
+    runs = {}
+    for sample, v in sample_dict.items():
+        if cgr_data:
+            p = fastq_abs_path + v[0] + '/CASAVA/L1/Project_' + v[1] + '/Sample_' + sample + '/'
+            fqs = [p + '*R1_001.fastq.gz', p + '*R2_001.fastq.gz']
+        else:
+            fqs = [v[2], v[3]]
+        runs.setdefault(v[0], []).extend(fqs)
+    return runs
+
+
+def fastq_sizes(patterns):
+    """Sizes of the fastqs matching each pattern, or None if any is missing or ambiguous."""
+    sizes = []
+    for p in patterns:
+        found = glob.glob(p)
+        if len(found) != 1:
+            return None
+        try:
+            sizes.append(os.path.getsize(found[0]))
+        except OSError:
+            return None
+    return sizes
+
+
+class RunWatcher(object):
+    """Tracks which run IDs are complete on disk and which branches are done."""
+
+    def __init__(self, runs, state_dir, marker=''):
+        self.runs = runs
+        self.state_dir = state_dir
+        self.marker = marker
+        self.last_sizes = {}
+        os.makedirs(state_dir, exist_ok=True)
+
+    def done(self, run_id):
+        return os.path.exists(os.path.join(self.state_dir, run_id + '.done'))
+
+    def mark_done(self, run_id):
+        with open(os.path.join(self.state_dir, run_id + '.done'), 'w') as f:
+            f.write(time.strftime('%Y-%m-%d %H:%M:%S') + '\n')
+
+    def ready(self, run_id):
+        """Whether all of a run ID's fastqs have landed (see module docstring)."""
+        sizes = fastq_sizes(self.runs[run_id])
+        if sizes is None:
+            return False
+        if self.marker:
+            return os.path.exists(self.marker.format(runID=run_id))
+        stable = self.last_sizes.get(run_id) == sizes
+        self.last_sizes[run_id] = sizes
+        return stable
+
+
+def launch(snakemake, run_id, log_dir, jobs):
+    cmd = snakemake + ' --jobs %d --nolock --config only_run_ids=%s -- per_run' % (jobs, run_id)
+    with open(os.path.join(log_dir, 'watch_' + run_id + '.out'), 'a') as log:
+        log.write('### watch: %s\n' % cmd)
+        log.flush()
+        return subprocess.Popen(cmd, shell=True, stdout=log, stderr=subprocess.STDOUT)
+
+
+def watch(watcher, run_ids, snakemake, log_dir, interval=300, timeout=None, jobs=10, branches=4):
+    """Run each run ID's branch once it is ready; return the run IDs that failed or never landed.
+
+    At most branches run at once, each with jobs // branches jobs.
+    """
+    share = max(1, jobs // branches)
+    pending = [r for r in run_ids if not watcher.done(r)]
+    for r in run_ids:
+        if r not in pending:
+            print('%s: already done' % r)
+    running, failed = {}, []
+    started = time.time()
+    while pending or running:
+        for r in list(pending):
+            if len(running) >= branches:
+                break
+            if watcher.ready(r):
+                print('%s: fastqs complete, starting' % r, flush=True)
+                running[r] = launch(snakemake, r, log_dir, share)
+                pending.remove(r)
+        for r, proc in list(running.items()):
+            if proc.poll() is not None:
+                del running[r]
+                if proc.returncode == 0:
+                    watcher.mark_done(r)
+                    print('%s: done' % r, flush=True)
+                else:
+                    failed.append(r)
+                    print('%s: FAILED (exit %d); see %s' % (r, proc.returncode, os.path.join(log_dir, 'watch_' + r + '.out')),
+                          flush=True)
+        if timeout and pending and time.time() - started > timeout:
+            print('Gave up waiting for: ' + ', '.join(pending), flush=True)
+            for proc in running.values():
+                proc.wait()
+            return failed + pending
+        if pending or running:
+            time.sleep(interval)
+    return failed
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Run per-run ID stages as each run lands, then the whole workflow.')
+    p.add_argument('config', help='pipeline config.yaml')
+    p.add_argument('snakemake', help='snakemake command line, without targets')
+    p.add_argument('--jobs', type=int, default=10, help='job budget shared by the running branches (default: %(default)s)')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    cgr_data = config['data_source'] == 'internal'
+    fastq_abs_path = config['fastq_abs_path'].rstrip('/') + '/' if cgr_data else ''
+    out_dir = pipeline_out_dir(config)
+    log_dir = out_dir + 'logs/'
+    os.makedirs(log_dir, exist_ok=True)
+    sample_dict, run_ids = load_manifest(config['metadata_manifest'], cgr_data)
+
+    if subprocess.call(args.snakemake + ' -- ' + out_dir + 'manifests/manifest_qiime2.tsv', shell=True):
+        sys.exit('ERROR: check_manifest failed')
+    watcher = RunWatcher(run_fastqs(sample_dict, cgr_data, fastq_abs_path), out_dir + 'watch/',
+                         config.get('watch_marker') or '')
+    timeout = config.get('watch_timeout_hours')
+    failed = watch(watcher, run_ids, args.snakemake, log_dir, config.get('watch_interval', 300),
+                   timeout * 3600 if timeout else None, args.jobs, config.get('watch_branches') or 4)
+    if failed:
+        sys.exit('ERROR: not all run IDs finished (' + ', '.join(failed) + '); fix and restart to resume')
+    print('All run IDs done; running the cross-run stages', flush=True)
+    sys.exit(subprocess.call(args.snakemake, shell=True))
+
+
+if __name__ == '__main__':
+    main()